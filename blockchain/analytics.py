@@ -0,0 +1,147 @@
+"""
+Columnar export of a chain for analytics: the headers and the metadata of the transactions are put in NumPy
+structured arrays, one row per block or per transaction, so throughput, miner counts or message volumes are computed
+with vectorized operations instead of walking the blocks one by one.
+numpy is only needed by this module, the blockchain itself works without it.
+"""
+
+
+from hashlib import sha256
+
+import encoding
+from python_blockchain import Blockchain, header_bytes
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+BLOCK_DTYPE = [('index', 'u8'), ('timestamp', 'f8'), ('nonce', 'u8'), ('bits', 'u1'), ('transactions', 'u4'),
+               ('hash', 'S32')]
+TX_DTYPE = [('height', 'u8'), ('position', 'u4'), ('sender', 'u4'), ('recipient', 'u4'), ('quantity', 'f8'),
+            ('payload_size', 'u4')]
+
+
+class ColumnarExport:
+    """
+    Columns of the blocks and of the transactions of a chain, brought up to date by update with the new blocks only.
+    Addresses are given ids in the order they are met: addresses[id] is the address of an id.
+    """
+
+    def __init__(self, blockchain: Blockchain, start_height=0) -> None:
+        """
+        Initialization of the ColumnarExport class
+
+        :param Blockchain blockchain: blockchain exported
+        :param int start_height: first height exported, above the pruned blocks of a chain loaded from a snapshot
+        :raise: ImportError if numpy is not installed
+        """
+
+        if np is None:
+            raise ImportError('the columnar export needs numpy: pip install numpy')
+
+        self.blockchain = blockchain
+        self.start_height = start_height
+        self.ids = {}       # address -> id
+        self.addresses = [] # id -> address
+        self._blocks = [np.empty(0, BLOCK_DTYPE)] # arrays exported by each update, joined when they are read
+        self._transactions = [np.empty(0, TX_DTYPE)]
+
+
+    def _id(self, address: object) -> int:
+        """
+        :param address: sender or recipient
+        :return: id of the address, a new one if it was never met
+        :rtype: int
+        """
+
+        number = self.ids.get(address)
+        if number is None:
+            number = self.ids[address] = len(self.addresses)
+            self.addresses.append(address)
+
+        return number
+
+
+    @property
+    def blocks(self) -> object:
+        """
+        :return: one row per block exported, in chain order: index, timestamp, nonce, bits, number of transactions
+            and raw hash
+        :rtype: numpy.ndarray
+        """
+
+        if len(self._blocks) > 1:
+            self._blocks = [np.concatenate(self._blocks)]
+
+        return self._blocks[0]
+
+
+    @property
+    def transactions(self) -> object:
+        """
+        :return: one row per transaction exported, in chain order: height, position in the block, sender id,
+            recipient id, quantity and size of the encoded message in bytes
+        :rtype: numpy.ndarray
+        """
+
+        if len(self._transactions) > 1:
+            self._transactions = [np.concatenate(self._transactions)]
+
+        return self._transactions[0]
+
+
+    def _common_height(self) -> int:
+        """
+        Number of exported blocks still in the chain: the last ones may have been replaced by a chain with more work
+
+        :return: height of the first exported block which is not in the chain any more
+        :rtype: int
+        """
+
+        chain = self.blockchain.chain
+        hashes = self.blocks['hash']
+        height = self.start_height + len(hashes)
+
+        while height > self.start_height:
+            if height <= len(chain) and sha256(header_bytes(chain, height - 1)).digest() == hashes[-1]:
+                break
+            height -= 1
+            hashes = hashes[:-1]
+
+        return height
+
+
+    def update(self) -> int:
+        """
+        Export the blocks appended since the last update; blocks replaced by a chain with more work are exported again
+
+        :return: number of blocks exported
+        :rtype: int
+        :raise: LookupError if a block to export was pruned, see snapshot.prune
+        """
+
+        with self.blockchain.lock:
+            chain = self.blockchain.chain
+            height = self._common_height()
+            kept = height - self.start_height
+            if kept < len(self.blocks):
+                self._blocks = [self.blocks[:kept]]
+                transactions = self.transactions
+                self._transactions = [transactions[:np.searchsorted(transactions['height'], height)]]
+
+            blocks, transactions = [], []
+            for block in chain[height:]:
+                data = block.data
+                blocks.append((block.index, block.timestamp, block.nonce, block.bits, len(data),
+                               bytes.fromhex(block.hash_calculation)))
+                transactions.extend((block.index, position, self._id(tx['sender']), self._id(tx['recipient']),
+                                     tx['quantity'], len(encoding.encode(tx['message'])))
+                                    for position, tx in enumerate(data))
+
+        if blocks:
+            self._blocks.append(np.array(blocks, BLOCK_DTYPE))
+            self._transactions.append(np.array(transactions, TX_DTYPE))
+
+        return len(blocks)
@@ -0,0 +1,128 @@
+"""
+Arena shared by the blocks of a chain: the encoded transactions of every block are appended to one buffer, instead of
+keeping a list of dicts per block
+"""
+
+
+from array import array
+
+import encoding
+
+
+class TxArena:
+    """
+    Encoded transactions of many blocks, one after the other in a single buffer.
+    A block is a slot: slot i holds the transactions first[i] to first[i + 1] - 1.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initialization of the TxArena class
+        """
+
+        self.buffer = bytearray()
+        self.offsets = array('Q', [0]) # offsets[t] is the start of transaction t, offsets[-1] the end of the buffer
+        self.first = array('Q', [0])   # first[s] is the first transaction of slot s
+
+
+    def __reduce__(self) -> tuple:
+        # blocks are pickled through their own encoding, a pickled arena starts empty
+        return TxArena, ()
+
+
+    def add(self, encoded_txs: list) -> int:
+        """
+        Append the transactions of a block
+
+        :param list encoded_txs: binary encoding of each transaction
+        :return: slot of the block
+        :rtype: int
+        """
+
+        for raw in encoded_txs:
+            self.buffer += raw
+            self.offsets.append(len(self.buffer))
+
+        self.first.append(len(self.offsets) - 1)
+        return len(self.first) - 2
+
+
+    def count(self, slot: int) -> int:
+        """
+        :param int slot: slot of a block
+        :return: number of transactions of the block
+        :rtype: int
+        """
+
+        return self.first[slot + 1] - self.first[slot]
+
+
+    def encoded(self, slot: int) -> list:
+        """
+        Binary encoding of each transaction of a block
+
+        :param int slot: slot of a block
+        :return: list of the encoded transactions
+        :rtype: list[bytes]
+        """
+
+        offsets, buffer = self.offsets, self.buffer
+        return [bytes(buffer[offsets[t]:offsets[t + 1]]) for t in range(self.first[slot], self.first[slot + 1])]
+
+
+    def raw(self, slot: int) -> bytes:
+        """
+        Binary encoding of all the transactions of a block, back to back
+
+        :param int slot: slot of a block
+        :return: the encoded transactions
+        :rtype: bytes
+        """
+
+        return bytes(self.buffer[self.offsets[self.first[slot]]:self.offsets[self.first[slot + 1]]])
+
+
+    def transaction(self, slot: int, position: int) -> object:
+        """
+        Decode one transaction of a block
+
+        :param int slot: slot of a block
+        :param int position: position of the transaction in the block
+        :return: the transaction
+        :rtype: object
+        :raise: IndexError if there is no transaction at this position
+        """
+
+        if not 0 <= position < self.count(slot):
+            raise IndexError(f'no transaction at position {position}')
+
+        t = self.first[slot] + position
+        return encoding.decode(bytes(self.buffer[self.offsets[t]:self.offsets[t + 1]]))[0]
+
+
+    def transactions(self, slot: int) -> list:
+        """
+        Decode all the transactions of a block
+
+        :param int slot: slot of a block
+        :return: the transactions
+        :rtype: list
+        """
+
+        return [encoding.decode(raw)[0] for raw in self.encoded(slot)]
+
+
+    def truncate(self, slot: int) -> None:
+        """
+        Drop the transactions of a slot and of all the slots after it, to release the blocks rolled back
+
+        :param int slot: first slot dropped
+        """
+
+        if slot >= len(self.first) - 1:
+            return
+
+        first = self.first[slot]
+        del self.buffer[self.offsets[first]:]
+        del self.offsets[first + 1:]
+        del self.first[slot + 1:]
@@ -0,0 +1,162 @@
+"""
+Proof of authority, for a permissioned network whose participants are known: the blocks are signed in turn by a fixed
+list of authorities, with their RSA or ECC key, instead of being mined. A block is produced in the time of one
+signature, and it is checked with the public key of the authority whose turn it was.
+"""
+
+
+from Crypto.Hash import SHA256
+from Crypto.PublicKey import ECC, RSA
+from Crypto.Signature import DSS, pss
+
+import encoding
+
+
+def _scheme(key: object) -> object:
+    """
+    :param key: RSA or ECC key
+    :return: signature scheme of the key: PKCS#1 PSS for RSA, like encryption.RSASignature, DSS for ECC
+    :rtype: object
+    """
+
+    if isinstance(key, RSA.RsaKey):
+        return pss.new(key)
+
+    return DSS.new(key, 'fips-186-3')
+
+
+def _export(key: object) -> str:
+    """
+    :param key: RSA or ECC public key
+    :return: the key in PEM format
+    :rtype: str
+    """
+
+    pem = key.export_key(format='PEM')
+    return pem.decode() if isinstance(pem, bytes) else pem
+
+
+def _import(pem: str) -> object:
+    """
+    :param str pem: RSA or ECC key in PEM format
+    :return: the key
+    :rtype: RSA.RsaKey or ECC.EccKey
+    """
+
+    try:
+        return RSA.import_key(pem)
+    except ValueError:
+        return ECC.import_key(pem)
+
+
+
+class ProofOfAuthority:
+    """
+    Consensus rule of a proof of authority chain: the block at a height is signed by the authority at position
+    height % number of authorities. Every node of the chain must use the same list of authorities.
+    """
+
+    def __init__(self, authorities: list, key=None) -> None:
+        """
+        Initialization of the ProofOfAuthority class
+
+        :param list authorities: RSA or ECC keys of the authorities, in the order of their turns
+        :param key: private key of this node if it is one of the authorities, None for a node which only checks blocks
+        :raise: ValueError if the key is not the one of an authority
+        """
+
+        self.authorities = [authority.public_key() for authority in authorities]
+        self.key = key
+        self.position = None # position of this node in the turns
+
+        if key is not None:
+            exported = _export(key.public_key())
+            positions = [i for i, authority in enumerate(self.authorities) if _export(authority) == exported]
+            if not positions:
+                raise ValueError('the key is not the one of an authority of the chain')
+            self.position = positions[0]
+
+
+    def signer_at(self, height: int) -> int:
+        """
+        :param int height: height of a block
+        :return: position of the authority which signs it
+        :rtype: int
+        """
+
+        return height % len(self.authorities)
+
+
+    def can_sign(self, height: int) -> bool:
+        """
+        :param int height: height of a block
+        :return: True if it is the turn of this node to sign it
+        :rtype: bool
+        """
+
+        return self.position is not None and self.signer_at(height) == self.position
+
+
+    def sign(self, height: int, header: bytes) -> bytes:
+        """
+        Sign the header of a block, see Block.seal
+
+        :param int height: height of the block
+        :param bytes header: encoded header, without signature
+        :return: the signature
+        :rtype: bytes
+        :raise: ValueError if it is not the turn of this node
+        """
+
+        if not self.can_sign(height):
+            raise ValueError(f'block {height} must be signed by authority {self.signer_at(height)}')
+
+        return _scheme(self.key).sign(SHA256.new(header))
+
+
+    def verify(self, height: int, header: bytes) -> bool:
+        """
+        Check the signature of the header of a block
+
+        :param int height: height of the block
+        :param bytes header: encoded header, with its signature
+        :return: True if it is signed by the authority whose turn it was, False otherwise
+        :rtype: bool
+        """
+
+        unsigned, signature = encoding.split_signature(header)
+        if not signature:
+            return False
+
+        try:
+            _scheme(self.authorities[self.signer_at(height)]).verify(SHA256.new(unsigned), signature)
+        except (ValueError, TypeError):
+            return False
+
+        return True
+
+
+    def export(self) -> list:
+        """
+        :return: public keys of the authorities in PEM format, to be saved with the chain
+        :rtype: list[str]
+        """
+
+        return [_export(authority) for authority in self.authorities]
+
+
+    @classmethod
+    def from_export(cls, exported: list, key=None) -> 'ProofOfAuthority':
+        """
+        :param list exported: public keys given by export
+        :param key: private key of this node if it is one of the authorities
+        :return: the rule
+        :rtype: ProofOfAuthority
+        """
+
+        return cls([_import(pem) for pem in exported], key)
+
+
+    def __reduce__(self) -> tuple:
+        # the processes checking a chain only need the public keys
+        return ProofOfAuthority.from_export, (self.export(),)
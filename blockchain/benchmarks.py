@@ -0,0 +1,250 @@
+"""
+Benchmarks of the blockchain, run with: python benchmarks.py [name ...]
+Without argument, every benchmark is run.
+"""
+
+
+import sys
+import os
+import random
+import tracemalloc
+from time import perf_counter
+
+import python_blockchain
+from arena import TxArena
+from mining import ParallelMiner
+from pow_engine import HexdigestEngine, MidstateEngine
+from retarget import Retarget
+
+
+def bench_parallel_mining(bits=20, rounds=4) -> None:
+    """
+    Hashes per second of the proof of work according to the number of processes.
+    Only the nonces before the one found are counted, as the single core loop would have tested them.
+
+    :param int bits: number of zero bits required at the beginning of the hash
+    :param int rounds: number of nonces to find for each number of processes
+    """
+
+    print(f'Parallel mining, difficulty {bits} bits, {rounds} rounds')
+    cores = os.cpu_count()
+    counts = sorted({1, 2, 4, cores} | {cores * 2})
+
+    for workers in counts:
+        with ParallelMiner(workers) as miner:
+            hashes = 0
+            start = perf_counter()
+            for last_nonce in range(rounds):
+                hashes += miner.search(last_nonce, bits) + 1
+            elapsed = perf_counter() - start
+
+        print(f'  {workers:>3} workers: {hashes / elapsed:>12,.0f} H/s')
+
+
+
+def bench_pow_kernel(nonces=500000) -> None:
+    """
+    Hashes per second of the single core proof of work engines, over a range where no nonce is valid
+
+    :param int nonces: number of nonces tested by each engine
+    """
+
+    print(f'Proof of work kernels, {nonces} nonces')
+    impossible = 256 # no hash is only zeros: the whole range is searched
+
+    for engine in (HexdigestEngine(), MidstateEngine()):
+        start = perf_counter()
+        engine.search(12345, impossible, 0, nonces)
+        elapsed = perf_counter() - start
+        print(f'  {type(engine).__name__:>16}: {nonces / elapsed:>12,.0f} H/s')
+
+
+
+def _sealed_blocks(blocks: int, arena: object) -> tuple:
+    """
+    Seal a run of linked blocks holding one transaction each, as block_mining would
+
+    :param int blocks: number of blocks
+    :param TxArena arena: arena of the transactions, None to keep them in each block
+    :return: the blocks, and the memory in bytes they take
+    :rtype: tuple[list, int]
+    """
+
+    tracemalloc.start()
+    chain = []
+    prev_hash = '0'
+    for i in range(blocks):
+        tx = {'sender': '0', 'recipient': f'miner {i % 100}', 'quantity': 1, 'message': '***Mining new block***'}
+        block = python_blockchain.Block(i, i * 7919, prev_hash, [tx], 1.6e9 + i)
+        prev_hash = block.seal(arena)
+        chain.append(block)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return chain, size
+
+
+
+def bench_block_memory(blocks=1000000) -> None:
+    """
+    Memory taken by each block of a long chain, with its transactions in the shared arena or in its own list.
+    The list layout is measured on fewer blocks, its cost per block doesn't depend on the length.
+
+    :param int blocks: number of blocks of the chain
+    """
+
+    print(f'Block memory, {blocks} blocks with 1 transaction')
+
+    for label, count, arena in (('arena', blocks, TxArena()), ('list data', blocks // 10, None)):
+        start = perf_counter()
+        chain, size = _sealed_blocks(count, arena)
+        elapsed = perf_counter() - start
+        print(f'  {label:>10}: {size / count:>8,.0f} bytes/block over {count} blocks, sealed in {elapsed:.1f} s')
+        del chain
+
+
+
+def bench_difficulty(windows=32, seed=0) -> None:
+    """
+    Simulated block times while the hash rate of the network changes, with the difficulty rule of Retarget.
+    No hash is computed: a block takes an exponential time of mean 2**bits / hash rate, as each nonce has a chance of
+    1 / 2**bits to be valid.
+
+    :param int windows: number of retarget intervals simulated
+    :param int seed: seed of the random generator
+    """
+
+    retarget = Retarget()
+    rng = random.Random(seed)
+    rates = [2e5, 2e6, 5e4, 1e6] # hash rates in H/s, each one for a quarter of the simulation
+    timestamps, bits = [0.0], retarget.initial_bits
+
+    print(f'Difficulty retarget, every {retarget.interval} blocks, target {retarget.block_time} s')
+    print(f'  {"window":>6} {"H/s":>10} {"bits":>5} {"mean block time":>16}')
+
+    for window in range(windows):
+        rate = rates[window * len(rates) // windows]
+        start = timestamps[-1]
+        for _ in range(retarget.interval):
+            bits = retarget.expected(len(timestamps), bits, timestamps.__getitem__)
+            timestamps.append(timestamps[-1] + rng.expovariate(rate / 2**bits))
+
+        mean = (timestamps[-1] - start) / retarget.interval
+        print(f'  {window:>6} {rate:>10,.0f} {bits:>5} {mean:>14.2f} s')
+
+
+
+def bench_bloom_scan(blocks=5000, per_block=20, rates=(0.1, 0.01, 0.001), seed=0) -> None:
+    """
+    Transactions of one recipient found by Blockchain.scan, which skips the blocks on their bloom filter, against
+    decoding the transactions of every block
+
+    :param int blocks: number of blocks of the chain
+    :param int per_block: number of transactions per block
+    :param tuple rates: false positive rates of the bloom filters compared
+    :param int seed: seed of the random generator
+    """
+
+    print(f'Bloom filter scan, {blocks} blocks of {per_block} transactions')
+    print(f'  {"rate":>6} {"header":>7} {"blocks read":>12} {"scan":>9} {"full decode":>12}')
+
+    for rate in rates:
+        rng = random.Random(seed)
+        arena = TxArena()
+        chain = []
+        prev_hash = '0'
+        for i in range(blocks):
+            data = [{'sender': f'doctor {rng.randrange(1000)}', 'recipient': f'lab {rng.randrange(1000)}',
+                     'quantity': 1, 'message': 'x' * 64} for _ in range(per_block)]
+            block = python_blockchain.Block(i, i, prev_hash, data, 1.6e9 + i)
+            prev_hash = block.seal(arena, rate)
+            chain.append(block)
+
+        state = {'recipient_index': {}, 'sender_index': {}, 'latest_minstd': None, 'verified_height': 0}
+        blockchain = python_blockchain.Blockchain(chain, state=state)
+        blockchain.arena = arena
+
+        start = perf_counter()
+        found = list(blockchain.scan('lab 7', field='recipient'))
+        scan = perf_counter() - start
+
+        start = perf_counter()
+        expected = [(block.index, position, tx) for block in chain for position, tx in enumerate(block.data)
+                    if tx['recipient'] == 'lab 7']
+        full = perf_counter() - start
+        assert found == expected
+
+        read = sum(block.might_concern('lab 7') for block in chain)
+        size = sum(len(block.header_bytes()) for block in chain) / blocks
+        print(f'  {rate:>6} {size:>5.0f} B {read:>12} {scan * 1e3:>7.1f} ms {full * 1e3:>9.1f} ms')
+
+
+
+def bench_block_production(blocks=20) -> None:
+    """
+    Time taken to add a block, found by proof of work at the initial difficulty or signed by a proof of authority
+    with an RSA or an ECC key
+
+    :param int blocks: number of blocks added by each mode
+    """
+
+    from Crypto.PublicKey import ECC, RSA
+    from authority import ProofOfAuthority
+
+    print(f'Block production, {blocks} blocks')
+    modes = [('proof of work', None)]
+    for label, key in (('RSA 2048', RSA.generate(2048)), ('ECC P-256', ECC.generate(curve='P-256'))):
+        modes.append((f'authority {label}', ProofOfAuthority([key], key)))
+
+    for label, authority in modes:
+        blockchain = python_blockchain.Blockchain(authority=authority)
+        start = perf_counter()
+        for _ in range(blocks):
+            blockchain.block_mining('bench')
+        elapsed = perf_counter() - start
+        print(f'  {label:>20}: {elapsed / blocks * 1e3:>10.2f} ms/block')
+
+
+
+def bench_request_batch(messages=64, pools=(1, 2, 4, 8)) -> None:
+    """
+    Messages built per second by handle_transactions.request_info_batch, against the number of threads: the RSA
+    signatures and encryptions run in parallel when the Crypto module releases the GIL
+
+    :param int messages: number of requests of the batch
+    :param tuple pools: numbers of threads tried
+    """
+
+    from handle_transactions import request_info_batch
+    from cryptographie.code.src.encryption import newKeyPair
+
+    senderPublicKey, senderPrivateKey = newKeyPair()
+    recipientPublicKey, _ = newKeyPair()
+    requests = [(i, f'request {i}', i, 48271, '127.0.0.1', recipientPublicKey) for i in range(messages)]
+
+    print(f'Batch of {messages} requests, {os.cpu_count()} cpus')
+    for workers in pools:
+        start = perf_counter()
+        request_info_batch(requests, senderPrivateKey, workers)
+        elapsed = perf_counter() - start
+        print(f'  {workers:>3} threads: {messages / elapsed:>10.1f} messages/s')
+
+
+
+BENCHMARKS = {
+    'block_production': bench_block_production,
+    'request_batch': bench_request_batch,
+    'bloom_scan': bench_bloom_scan,
+    'difficulty': bench_difficulty,
+    'block_memory': bench_block_memory,
+    'parallel_mining': bench_parallel_mining,
+    'pow_kernel': bench_pow_kernel,
+}
+
+
+if __name__ == '__main__':
+
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
+        print()
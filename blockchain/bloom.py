@@ -0,0 +1,110 @@
+"""
+Bloom filters over the addresses of a block, carried by its header: a light node tells whether a block may concern an
+address without reading its transactions. A filter never misses an address it holds, and wrongly matches an address
+it doesn't hold with the chosen false positive rate.
+"""
+
+
+from hashlib import blake2b
+from math import ceil, log
+
+
+BLOOM_RATE = 0.01 # default false positive rate
+
+
+def parameters(count: int, rate: float) -> tuple:
+    """
+    Size of a filter and number of hashes for a number of items and a false positive rate
+
+    :param int count: number of items in the filter
+    :param float rate: false positive rate wanted, between 0 and 1
+    :return: size of the filter in bytes and number of hashes
+    :rtype: tuple[int, int]
+    """
+
+    if not count:
+        return 0, 0
+
+    # even at a rate of 1, a filter holding items has a byte: an empty filter would never match them
+    bits = max(1, ceil(-count * log(rate) / log(2)**2))
+    size = -(-bits // 8)
+    return size, max(1, round(size * 8 / count * log(2)))
+
+
+def valid_parameters(count: int, size: int, hashes: int) -> bool:
+    """
+    Parameters a block may declare for its filter: the filter is rebuilt with them to check the block, and an empty
+    filter, or one without hashes, would hide the addresses it should hold
+
+    :param int count: number of items in the filter
+    :param int size: size of the filter in bytes
+    :param int hashes: number of hashes
+    :return: True if a filter of this size and number of hashes can hold the items
+    :rtype: bool
+    """
+
+    if not count:
+        return size == 0 and hashes == 0
+
+    return size > 0 and hashes > 0
+
+
+def _positions(item: bytes, size: int, hashes: int) -> list:
+    """
+    Bits of an item in a filter, 4 bytes of digest each: small filters are common, and positions derived from two
+    hashes would often repeat on them
+
+    :param bytes item: item
+    :param int size: size of the filter in bytes
+    :param int hashes: number of hashes
+    :return: the bit positions
+    :rtype: list[int]
+    """
+
+    digest = b''
+    while len(digest) < 4 * hashes:
+        digest += blake2b(item, salt=len(digest).to_bytes(16, 'big')).digest()
+
+    bits = size * 8
+    return [int.from_bytes(digest[4 * i:4 * i + 4], 'big') % bits for i in range(hashes)]
+
+
+def build(items: set, rate=BLOOM_RATE, hashes=None, size=None) -> tuple:
+    """
+    Build the filter of a set of items
+
+    :param set items: items, as bytes
+    :param float rate: false positive rate wanted
+    :param int hashes: number of hashes, given with size to rebuild a filter with the same parameters
+    :param int size: size of the filter in bytes
+    :return: number of hashes and the filter
+    :rtype: tuple[int, bytes]
+    """
+
+    if hashes is None:
+        size, hashes = parameters(len(items), rate)
+
+    bloom = bytearray(size)
+    if size:
+        for item in items:
+            for position in _positions(item, size, hashes):
+                bloom[position >> 3] |= 1 << (position & 7)
+
+    return hashes, bytes(bloom)
+
+
+def might_contain(bloom: bytes, hashes: int, item: bytes) -> bool:
+    """
+    Test an item against a filter
+
+    :param bytes bloom: the filter
+    :param int hashes: number of hashes of the filter
+    :param bytes item: item
+    :return: False if the item is surely not in the filter, True if it may be
+    :rtype: bool
+    """
+
+    if not bloom:
+        return False
+
+    return all(bloom[position >> 3] >> (position & 7) & 1 for position in _positions(item, len(bloom), hashes))
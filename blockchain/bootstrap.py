@@ -0,0 +1,169 @@
+"""
+Streaming export and import of a chain, to bootstrap a node on another machine without pickling the whole Blockchain.
+The stream is a small header then one record per block, in chain order; it is written and read block by block, and
+the blocks are checked by batches as they are imported, so only one batch of decoded blocks is held at a time. The
+Blockchain itself still grows with the chain: its address indexes and timestamps keep an entry per block or
+transaction, whether the blocks are in a list or a ChainStore.
+"""
+
+
+import os
+import zlib
+
+import encoding
+from chain_store import RECORD
+from python_blockchain import Block, Blockchain
+from retarget import Retarget
+
+
+STREAM_VERSION = 1
+MAGIC = b'MBCS'     # first bytes of a stream
+IMPORT_BATCH = 500  # blocks checked and added together
+
+
+def export_chain(blockchain: Blockchain, path: str, start_height=0) -> int:
+    """
+    Write the blocks of a chain from a height to a stream file.
+    The blocks of a ChainStore are copied as they are stored, without decoding them.
+
+    :param Blockchain blockchain: blockchain exported
+    :param str path: path of the stream file
+    :param int start_height: first height written, to resume an export or to send only the blocks a node misses
+    :return: number of blocks written
+    :rtype: int
+    :raise: LookupError if a block to export was pruned, see snapshot.prune
+    """
+
+    chain = blockchain.chain
+    retarget = blockchain.retarget
+    header = encoding.encode({
+        'version': STREAM_VERSION,
+        'start': start_height,
+        'retarget': [retarget.initial_bits, retarget.interval, retarget.block_time, retarget.max_step],
+        'authorities': blockchain.authority.export() if blockchain.authority is not None else None,
+    })
+
+    with open(path, 'wb') as file:
+        file.write(MAGIC + encoding.LENGTH.pack(len(header)) + header)
+
+        height = start_height
+        while height < len(chain):
+            if hasattr(chain, 'read_bytes'):
+                chunks = [chain.read_bytes(height)]
+            else:
+                chunks = chain[height].byte_chunks()
+
+            crc = 0
+            for chunk in chunks:
+                crc = zlib.crc32(chunk, crc)
+            file.write(RECORD.pack(sum(len(chunk) for chunk in chunks), crc))
+            for chunk in chunks:
+                file.write(chunk)
+            height += 1
+
+    return height - start_height
+
+
+def _read_exactly(file: object, size: int) -> bytes:
+    """
+    :param file: stream file
+    :param int size: number of bytes to read
+    :return: the bytes read
+    :rtype: bytes
+    :raise: ValueError if the file ends before
+    """
+
+    data = file.read(size)
+    if len(data) != size:
+        raise ValueError('the stream is truncated')
+
+    return data
+
+
+def _records(file: object, skip_below: int):
+    """
+    Read the blocks of a stream one by one
+
+    :param file: stream file, after its header
+    :param int skip_below: the blocks below this height are skipped without being decoded
+    :return: generator of the blocks
+    :rtype: generator
+    :raise: ValueError if a record is truncated or corrupted
+    """
+
+    size = os.fstat(file.fileno()).st_size
+    while True:
+        prefix = file.read(RECORD.size)
+        if not prefix:
+            return
+        if len(prefix) != RECORD.size:
+            raise ValueError('the stream is truncated')
+        length, crc = RECORD.unpack(prefix)
+
+        head = _read_exactly(file, min(length, encoding.HEADER.size))
+        if len(head) == encoding.HEADER.size and encoding.HEADER.unpack(head)[1] < skip_below:
+            # seeking past the end of the file doesn't fail, the record is only found truncated by its position
+            if file.seek(length - len(head), 1) > size:
+                raise ValueError('the stream is truncated')
+            continue
+
+        raw = head + _read_exactly(file, length - len(head))
+        if zlib.crc32(raw) != crc:
+            raise ValueError('corrupted record in the stream')
+        yield Block.from_bytes(raw)
+
+
+def import_chain(path: str, blockchain=None, chain=None, batch=IMPORT_BATCH, key=None) -> Blockchain:
+    """
+    Add the blocks of a stream file to a blockchain, checking each batch against the blocks before it.
+    The blocks the blockchain already has are skipped: an interrupted import is resumed by running it again on the
+    same blockchain, or on a new one over the same ChainStore. A new Blockchain over a ChainStore already holding
+    blocks reads them all again to rebuild its indexes, see Blockchain.reindex, before the import resumes.
+
+    :param str path: path of the stream file
+    :param Blockchain blockchain: blockchain the blocks are added to, after its last block; a new one if None
+    :param chain: where a new blockchain keeps its blocks, a list if None; a chain_store.ChainStore keeps the blocks
+        on disk, only the indexes and the timestamps of the Blockchain stay in memory
+    :param int batch: number of blocks checked and added together
+    :param key: private key of this node if it is an authority of the proof of authority chain of a new blockchain
+    :return: the blockchain
+    :rtype: Blockchain
+    :raise: ValueError if the stream is not valid or if a block is invalid; the batches before it stay imported
+    """
+
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a chain stream')
+        size, = encoding.LENGTH.unpack(_read_exactly(file, encoding.LENGTH.size))
+        header, _ = encoding.decode(_read_exactly(file, size))
+        if header.get('version') != STREAM_VERSION:
+            raise ValueError(f'{path} is not a chain stream of version {STREAM_VERSION}')
+
+        if blockchain is None:
+            chain = chain if chain is not None else []
+            if not len(chain):
+                if header['start'] != 0:
+                    raise ValueError('a new blockchain needs a stream starting at the genesis block')
+                genesis = next(_records(file, 0), None)
+                if genesis is None:
+                    raise ValueError('the stream holds no block')
+                chain.append(genesis)
+            authority = None
+            if header.get('authorities') is not None:
+                from authority import ProofOfAuthority # a proof of work stream is read without Crypto
+                authority = ProofOfAuthority.from_export(header['authorities'], key)
+            blockchain = Blockchain(chain, Retarget(*header['retarget']), authority=authority)
+
+        if header['start'] > len(blockchain.chain):
+            raise ValueError(f'the stream starts at height {header["start"]}, after the end of the chain')
+
+        blocks = []
+        for block in _records(file, len(blockchain.chain)):
+            blocks.append(block)
+            if len(blocks) == batch:
+                blockchain.replace_from(len(blockchain.chain), blocks)
+                blocks = []
+        if blocks:
+            blockchain.replace_from(len(blockchain.chain), blocks)
+
+    return blockchain
@@ -0,0 +1,340 @@
+"""
+Persistent storage of a chain: the encoded blocks are appended to segment files, and a fixed-width index gives the
+position of each height. Blocks are read lazily through memory maps, so the history never has to fit in memory.
+"""
+
+
+import mmap
+import os
+import struct
+import zlib
+
+import encoding
+from python_blockchain import Block
+
+
+RECORD = struct.Struct('>II')   # length and crc32 of the encoded block, before the block itself
+ENTRY = struct.Struct('>IQI')   # segment number, offset and length of the record of a height
+SEGMENT_SIZE = 64 << 20         # a new segment file is started beyond this size
+INDEX_FILE = 'index.idx'
+
+
+class _MappedFile:
+    """
+    Read-only memory map of a file which only grows: it is mapped again when a read goes beyond the mapped part
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        :param str path: path of the file
+        """
+
+        self._file = open(path, 'rb')
+        self._map = None
+        self._size = 0
+
+
+    def view(self, offset: int, length: int) -> memoryview:
+        """
+        Give a view over a part of the file, without copying it
+
+        :param int offset: start of the part
+        :param int length: length of the part
+        :return: view over the part
+        :rtype: memoryview
+        """
+
+        if offset + length > self._size:
+            self._size = os.fstat(self._file.fileno()).st_size
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return memoryview(self._map)[offset:offset + length]
+
+
+    def close(self) -> None:
+        """
+        Close the map and the file
+        """
+
+        self._file.close()
+        self._map = None
+
+
+
+class ChainStore:
+    """
+    Append-only store of the blocks of a chain, usable in place of the Blockchain.chain list:
+    len(store), store[i], store[i:j], iteration and append.
+    """
+
+    def __init__(self, directory: str, segment_size=SEGMENT_SIZE, sync=False) -> None:
+        """
+        Open the store, creating it if needed and recovering from an interrupted write
+
+        :param str directory: directory of the segment and index files
+        :param int segment_size: size beyond which a new segment file is started
+        :param bool sync: if True, every append is flushed to the disk with fsync before returning
+        """
+
+        self.directory = directory
+        self.segment_size = segment_size
+        self.sync = sync
+        os.makedirs(directory, exist_ok=True)
+
+        self._recover()
+
+        self._index = open(os.path.join(directory, INDEX_FILE), 'ab')
+        self._length = self._index.tell() // ENTRY.size
+        self._index_map = _MappedFile(self._index.name)
+        self._segments = {} # segment number -> _MappedFile
+        self._last = None   # the last block is cached, it is read far more often than the others
+
+        segment, offset, length = self._entry(self._length - 1) if self._length else (0, 0, 0)
+        self._segment_number = segment
+        self._segment = open(self._segment_path(segment), 'ab')
+
+
+    def _segment_path(self, number: int) -> str:
+        """
+        :param int number: segment number
+        :return: path of the segment file
+        :rtype: str
+        """
+
+        return os.path.join(self.directory, f'segment-{number:06d}.blk')
+
+
+    def _recover(self) -> None:
+        """
+        Bring the index and the segments back to a consistent state after a crash:
+        a partial index entry or record is cut off, and complete records written after the last indexed one are
+        indexed again.
+        """
+
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        with open(index_path, 'ab+') as index:
+            count = index.tell() // ENTRY.size
+
+            # entries pointing beyond their segment were written before the record reached the disk
+            last = None
+            while count:
+                index.seek((count - 1) * ENTRY.size)
+                last = ENTRY.unpack(index.read(ENTRY.size))
+                path = self._segment_path(last[0])
+                if os.path.exists(path) and last[1] + last[2] <= os.path.getsize(path):
+                    break
+                count -= 1
+                last = None
+
+            index.truncate(count * ENTRY.size)
+
+            segment, end = (last[0], last[1] + last[2]) if last else (0, 0)
+            while os.path.exists(self._segment_path(segment)):
+                with open(self._segment_path(segment), 'rb+') as file:
+                    file.seek(end)
+                    data = file.read()
+                    position = 0
+
+                    while position + RECORD.size <= len(data):
+                        length, crc = RECORD.unpack_from(data, position)
+                        record_end = position + RECORD.size + length
+                        if record_end > len(data) or zlib.crc32(data[position + RECORD.size:record_end]) != crc:
+                            break
+                        index.write(ENTRY.pack(segment, end + position, RECORD.size + length))
+                        position = record_end
+
+                    if position != len(data):
+                        file.truncate(end + position)
+                        # nothing written after a torn record can be trusted
+                        while os.path.exists(self._segment_path(segment + 1)):
+                            segment += 1
+                            os.remove(self._segment_path(segment))
+
+                segment, end = segment + 1, 0
+
+
+    def _entry(self, height: int) -> tuple:
+        """
+        Read the index entry of a height
+
+        :param int height: height of the block
+        :return: segment number, offset and length of its record
+        :rtype: tuple[int, int, int]
+        """
+
+        return ENTRY.unpack(self._index_map.view(height * ENTRY.size, ENTRY.size))
+
+
+    def read_bytes(self, height: int) -> memoryview:
+        """
+        Encoded block at the given height, read through the memory map of its segment
+
+        :param int height: height of the block
+        :return: view over the encoded block
+        :rtype: memoryview
+        :raise: IndexError if there is no block at this height
+        """
+
+        if not 0 <= height < self._length:
+            raise IndexError(f'no block at height {height}')
+
+        segment, offset, length = self._entry(height)
+        if segment not in self._segments:
+            self._segments[segment] = _MappedFile(self._segment_path(segment))
+
+        return self._segments[segment].view(offset + RECORD.size, length - RECORD.size)
+
+
+    def header_bytes(self, height: int) -> bytes:
+        """
+        Encoded header of the block at the given height, without decoding its transactions
+
+        :param int height: height of the block
+        :return: the encoded header
+        :rtype: bytes
+        :raise: IndexError if there is no block at this height
+        """
+
+        view = self.read_bytes(height)
+        return bytes(view[:encoding.header_size(view)])
+
+
+    def __len__(self) -> int:
+        return self._length
+
+
+    def __getitem__(self, key: object) -> object:
+        """
+        Block at a height, or list of the blocks of a slice
+
+        :param key: height, negative heights count from the end, or slice
+        :return: block or list of blocks
+        :rtype: Block or list[Block]
+        """
+
+        if isinstance(key, slice):
+            return list(self.range(*key.indices(self._length)))
+
+        if key < 0:
+            key += self._length
+
+        if key == self._length - 1 and self._last is not None:
+            return self._last
+
+        return Block.from_bytes(self.read_bytes(key))
+
+
+    def range(self, start=0, stop=None, step=1):
+        """
+        Iterate over the blocks of a range of heights, reading them one at a time
+
+        :param int start: first height
+        :param int stop: end of the range (excluded), the length of the chain if None
+        :param int step: step between heights
+        :return: generator of the blocks
+        :rtype: generator
+        """
+
+        for height in range(start, self._length if stop is None else stop, step):
+            yield self[height]
+
+
+    def __iter__(self):
+        return self.range()
+
+
+    def append(self, block: Block) -> None:
+        """
+        Write a block at the end of the chain: the record first, then its index entry
+
+        :param Block block: the new block, at height len(store)
+        :raise: ValueError if the index of the block is not the next height
+        """
+
+        if block.index != self._length:
+            raise ValueError(f'block {block.index} cannot be stored at height {self._length}')
+
+        payload = block.to_bytes()
+        record_length = RECORD.size + len(payload)
+
+        if self._segment.tell() and self._segment.tell() + record_length > self.segment_size:
+            self._segment.close()
+            self._segment_number += 1
+            self._segment = open(self._segment_path(self._segment_number), 'ab')
+
+        offset = self._segment.tell()
+        self._segment.write(RECORD.pack(len(payload), zlib.crc32(payload)) + payload)
+        self._flush(self._segment)
+
+        self._index.write(ENTRY.pack(self._segment_number, offset, record_length))
+        self._flush(self._index)
+
+        self._length += 1
+        self._last = block
+
+
+    def truncate(self, height: int) -> None:
+        """
+        Drop the blocks from a height, to replace them by the ones of another chain
+
+        :param int height: height of the first block dropped
+        """
+
+        if height >= self._length:
+            return
+
+        segment, offset, length = self._entry(height)
+
+        # the maps over the shortened files are dropped before cutting them
+        self._segment.close()
+        for number in [number for number in self._segments if number >= segment]:
+            self._segments.pop(number).close()
+        self._index_map.close()
+
+        with open(self._segment_path(segment), 'rb+') as file:
+            file.truncate(offset)
+        while os.path.exists(self._segment_path(segment + 1)):
+            segment += 1
+            os.remove(self._segment_path(segment))
+
+        self._index.truncate(height * ENTRY.size)
+        self._flush(self._index)
+        self._index_map = _MappedFile(self._index.name)
+
+        self._length = height
+        self._last = None
+        self._segment_number, _, _ = self._entry(height - 1) if height else (0, 0, 0)
+        self._segment = open(self._segment_path(self._segment_number), 'ab')
+
+
+    def _flush(self, file: object) -> None:
+        """
+        Push the written data to the OS, and to the disk if the store is synchronous
+
+        :param file: file object
+        """
+
+        file.flush()
+        if self.sync:
+            os.fsync(file.fileno())
+
+
+    def close(self) -> None:
+        """
+        Close every file of the store
+        """
+
+        self._segment.close()
+        self._index.close()
+        self._index_map.close()
+        for segment in self._segments.values():
+            segment.close()
+        self._segments = {}
+
+
+    def __enter__(self) -> 'ChainStore':
+        return self
+
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,344 @@
+"""
+Canonical binary encoding of the blocks and of their transactions.
+Every value is a 1 byte type tag followed by its content; strings, bytes and containers are length-prefixed.
+The encoding only depends on the values, so it is the same on every machine and every Python version.
+"""
+
+
+import struct
+
+
+BLOCK_VERSION = 6
+# version, index, nonce, timestamp, difficulty bits, bloom hashes, bloom size, signature size, previous hash, merkle
+# root; the bloom filter of the addresses then the signature of a proof of authority chain follow
+HEADER = struct.Struct('>BQQdBBHH32s32s')
+TRAILER = struct.Struct('>HH')            # sizes of the bloom filter and of the signature, inside HEADER
+TRAILER_POSITION = HEADER.size - 68
+LENGTH = struct.Struct('>I')
+FLOAT = struct.Struct('>d')
+FLUSH_SIZE = 1 << 16              # a bytes payload this large is kept as its own chunk, without copy
+
+NONE, TRUE, FALSE, INT, FLOAT_TAG, STR, BYTES, LIST, DICT = b'NTFifsbld'
+CONSTANTS = {None: b'N', True: b'T', False: b'F'}
+STR_PREFIX, BYTES_PREFIX, LIST_PREFIX, DICT_PREFIX = b's', b'b', b'l', b'd'
+
+_key_cache = {}       # encoding of the dict keys met so far: a few names ('sender', 'recipient'...) repeat everywhere
+KEY_CACHE_SIZE = 1024
+
+
+def _encode_key(key: object) -> bytes:
+    """
+    Encoding of a dict key, cached for the strings
+
+    :param object key: the key
+    :return: the encoded key
+    :rtype: bytes
+    """
+
+    raw = _key_cache.get(key) if type(key) is str else None
+    if raw is None:
+        raw = encode(key)
+        if type(key) is str and len(_key_cache) < KEY_CACHE_SIZE:
+            _key_cache[key] = raw
+
+    return raw
+
+
+def _encode_into(value: object, out: bytearray, parts: list) -> bytearray:
+    """
+    Append the encoding of a value to out; a payload as large as FLUSH_SIZE is put in parts as it is, without copy
+
+    :param object value: value to encode
+    :param bytearray out: small fields being gathered
+    :param list parts: chunks already complete
+    :return: the bytearray to keep on gathering into
+    :rtype: bytearray
+    :raise: TypeError if the value can't be encoded
+    """
+
+    kind = type(value)
+
+    if kind is str:
+        raw = value.encode()
+        out += STR_PREFIX
+        out += LENGTH.pack(len(raw))
+        out += raw
+
+    elif kind is dict:
+        # the entries are sorted by encoded key: the insertion order doesn't change the encoding
+        out += DICT_PREFIX
+        out += LENGTH.pack(len(value))
+        for key, item in sorted((_encode_key(key), item) for key, item in value.items()):
+            out += key
+            out = _encode_into(item, out, parts)
+
+    elif kind in (list, tuple) or isinstance(value, (list, tuple)):
+        out += LIST_PREFIX
+        out += LENGTH.pack(len(value))
+        for item in value:
+            out = _encode_into(item, out, parts)
+
+    elif value is None or value is True or value is False:
+        out += CONSTANTS[value]
+
+    elif isinstance(value, int):
+        raw = value.to_bytes((value.bit_length() + 8) // 8, 'big', signed=True)
+        out.append(INT)
+        out.append(len(raw))
+        out += raw
+
+    elif isinstance(value, float):
+        out.append(FLOAT_TAG)
+        out += FLOAT.pack(value)
+
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        out += BYTES_PREFIX
+        out += LENGTH.pack(len(value))
+        if len(value) >= FLUSH_SIZE:
+            parts.append(out)
+            parts.append(value)
+            out = bytearray()
+        else:
+            out += value
+
+    else:
+        raise TypeError(f'cannot encode an object of type {kind.__name__}')
+
+    return out
+
+
+def encode_chunks(value: object) -> list:
+    """
+    Encode a value in chunks: the small fields are gathered, a large bytes payload is given as it is, without copy
+
+    :param object value: None, bool, int, float, str, bytes, list, tuple or dict of these
+    :return: the encoded chunks
+    :rtype: list
+    :raise: TypeError if the value can't be encoded
+    """
+
+    parts = []
+    out = _encode_into(value, bytearray(), parts)
+    if out:
+        parts.append(out)
+
+    return parts
+
+
+def encode(value: object) -> bytes:
+    """
+    Encode a value
+
+    :param object value: value to encode
+    :return: the encoded value
+    :rtype: bytes
+    """
+
+    parts = encode_chunks(value)
+    return bytes(parts[0]) if len(parts) == 1 else b''.join(parts)
+
+
+def _check_size(view: memoryview, offset: int, size: int) -> None:
+    """
+    :param memoryview view: encoded data
+    :param int offset: position of a field
+    :param int size: size of the field
+    :raise: ValueError if the data ends before the end of the field
+    """
+
+    if offset + size > len(view):
+        raise ValueError(f'truncated data: {size} bytes expected at position {offset}, {len(view) - offset} left')
+
+
+def decode(buffer: bytes, offset=0, views=False) -> tuple:
+    """
+    Decode the value starting at offset
+
+    :param bytes buffer: encoded data
+    :param int offset: position of the value in the buffer
+    :param bool views: if True, the bytes values are given as memoryview slices of the buffer instead of copies
+    :return: the value and the position just after it
+    :rtype: tuple[object, int]
+    :raise: ValueError if the data is not a valid encoding, or is truncated
+    """
+
+    view = memoryview(buffer)
+    _check_size(view, offset, 1)
+    tag = view[offset]
+    offset += 1
+
+    if tag == NONE:
+        return None, offset
+
+    elif tag == TRUE:
+        return True, offset
+
+    elif tag == FALSE:
+        return False, offset
+
+    elif tag == INT:
+        _check_size(view, offset, 1)
+        length = view[offset]
+        _check_size(view, offset + 1, length)
+        return int.from_bytes(view[offset + 1:offset + 1 + length], 'big', signed=True), offset + 1 + length
+
+    elif tag == FLOAT_TAG:
+        _check_size(view, offset, FLOAT.size)
+        return FLOAT.unpack_from(view, offset)[0], offset + FLOAT.size
+
+    elif tag in (STR, BYTES, LIST, DICT):
+        _check_size(view, offset, LENGTH.size)
+        length, = LENGTH.unpack_from(view, offset)
+        offset += LENGTH.size
+
+        if tag == STR:
+            _check_size(view, offset, length)
+            return str(view[offset:offset + length], 'utf-8'), offset + length
+
+        elif tag == BYTES:
+            _check_size(view, offset, length)
+            value = view[offset:offset + length]
+            return (value if views else value.tobytes()), offset + length
+
+        # each item takes at least one byte: a count larger than the data left is rejected before reading any item
+        _check_size(view, offset, length)
+
+        if tag == LIST:
+            items = []
+            for _ in range(length):
+                item, offset = decode(view, offset, views)
+                items.append(item)
+            return items, offset
+
+        items = {}
+        for _ in range(length):
+            key, offset = decode(view, offset)
+            if isinstance(key, (list, dict)):
+                raise ValueError(f'a dict key can\'t be a {type(key).__name__}')
+            items[key], offset = decode(view, offset, views)
+        return items, offset
+
+    raise ValueError(f'unknown type tag {tag!r} at position {offset - 1}')
+
+
+def encode_header(index: int, nonce: int, timestamp: float, bits: int, prev_hash: bytes, merkle_root: bytes,
+                  bloom_hashes=0, bloom=b'', signature=b'') -> bytes:
+    """
+    Encode the header of a block: the part its hash is computed on
+
+    :param int index: index of the block
+    :param int nonce: nonce of the block
+    :param float timestamp: timestamp of the block
+    :param int bits: difficulty of the block, number of zero bits of its proof hash
+    :param bytes prev_hash: raw previous block hash
+    :param bytes merkle_root: merkle root of the transactions
+    :param int bloom_hashes: number of hashes of the bloom filter
+    :param bytes bloom: bloom filter of the addresses of the transactions, see bloom.build
+    :param bytes signature: signature of the header without it, see authority.ProofOfAuthority
+    :return: the encoded header
+    :rtype: bytes
+    """
+
+    return HEADER.pack(BLOCK_VERSION, index, nonce, timestamp, bits, bloom_hashes, len(bloom), len(signature),
+                       prev_hash, merkle_root) + bloom + signature
+
+
+def header_size(buffer: bytes, offset=0) -> int:
+    """
+    Size of an encoded header, bloom filter and signature included
+
+    :param bytes buffer: buffer holding the header
+    :param int offset: position of the header in the buffer
+    :return: the size of the header
+    :rtype: int
+    """
+
+    return HEADER.size + sum(TRAILER.unpack_from(buffer, offset + TRAILER_POSITION))
+
+
+def split_signature(header: bytes) -> tuple:
+    """
+    :param bytes header: encoded header
+    :return: the header as it was signed, without signature, and the signature, empty if there is none
+    :rtype: tuple[bytes, bytes]
+    """
+
+    bloom_size, signature_size = TRAILER.unpack_from(header, TRAILER_POSITION)
+    end = len(header) - signature_size
+    unsigned = header[:TRAILER_POSITION] + TRAILER.pack(bloom_size, 0) + header[TRAILER_POSITION + TRAILER.size:end]
+
+    return bytes(unsigned), bytes(header[end:])
+
+
+def add_signature(header: bytes, signature: bytes) -> bytes:
+    """
+    :param bytes header: encoded header without signature
+    :param bytes signature: signature of the header
+    :return: the signed header
+    :rtype: bytes
+    """
+
+    bloom_size, _ = TRAILER.unpack_from(header, TRAILER_POSITION)
+    return header[:TRAILER_POSITION] + TRAILER.pack(bloom_size, len(signature)) + \
+        header[TRAILER_POSITION + TRAILER.size:] + signature
+
+
+def encode_block_chunks(header: bytes, data: list) -> list:
+    """
+    Encode a whole block in chunks: its header, then its transactions
+
+    :param bytes header: encoded header
+    :param list data: transactions of the block
+    :return: the encoded chunks
+    :rtype: list
+    """
+
+    parts = []
+    out = _encode_into(data, bytearray(header), parts)
+    parts.append(out)
+
+    return parts
+
+
+def list_prefix(length: int) -> bytes:
+    """
+    Beginning of the encoding of a list, before its items
+
+    :param int length: number of items
+    :return: the encoded prefix
+    :rtype: bytes
+    """
+
+    return LIST_PREFIX + LENGTH.pack(length)
+
+
+def decode_block(buffer: bytes) -> tuple:
+    """
+    Split an encoded block in its header and its transactions, each one checked but left encoded
+
+    :param bytes buffer: encoded block
+    :return: the encoded header and the binary encoding of each transaction
+    :rtype: tuple[bytes, list[bytes]]
+    :raise: ValueError if the data is not a valid encoded block
+    """
+
+    if len(buffer) < HEADER.size or buffer[0] != BLOCK_VERSION:
+        raise ValueError(f'unknown block version {buffer[0] if len(buffer) else None}')
+
+    view = memoryview(buffer)
+    size = header_size(view)
+    if len(view) < size + 1 + LENGTH.size or view[size] != LIST:
+        raise ValueError('the transactions of the block are missing')
+
+    count, = LENGTH.unpack_from(view, size + 1)
+    offset = size + 1 + LENGTH.size
+    encoded = []
+    for _ in range(count):
+        _, end = decode(view, offset)
+        encoded.append(view[offset:end].tobytes())
+        offset = end
+
+    if offset != len(view):
+        raise ValueError('trailing bytes after the block')
+
+    return view[:size].tobytes(), encoded
@@ -0,0 +1,68 @@
+"""
+Binary framing of the messages of the transactions: a magic number and a version, then the list of the fields in the
+canonical encoding of the blocks, see encoding.py. A field may hold any bytes, unlike the *DEL* / *SEP* separators
+which could appear in encrypted data, and a frame is read with memoryview slices: its bytes fields are not copied out
+of the message.
+"""
+
+
+import encoding
+
+
+MESSAGE_VERSION = 2
+MAGIC = b'MBCM' # first bytes of a framed message
+
+
+def frame(fields: list) -> bytes:
+    """
+    Encode fields in a framed message
+
+    :param list fields: bytes, str or int
+    :return: the message
+    :rtype: bytes
+    :raise: TypeError if a field has another type
+    """
+
+    for value in fields:
+        if not isinstance(value, (bytes, bytearray, memoryview, str, int)) or isinstance(value, bool):
+            raise TypeError(f'a message field can\'t hold a {type(value).__name__}')
+
+    return b''.join([MAGIC, bytes([MESSAGE_VERSION])] + encoding.encode_chunks(list(fields)))
+
+
+def is_framed(buffer: bytes) -> bool:
+    """
+    :param bytes buffer: message
+    :return: True if the message starts like a framed message, False for a message in the former formats
+    :rtype: bool
+    """
+
+    return bytes(buffer[:len(MAGIC)]) == MAGIC
+
+
+def unframe(buffer: bytes) -> list:
+    """
+    Decode the fields of a framed message
+
+    :param bytes buffer: message
+    :return: the fields; bytes fields are given as memoryview slices of the message
+    :rtype: list
+    :raise: ValueError if the message is not framed, has another version, is truncated or holds anything but a list
+        of fields
+    """
+
+    view = memoryview(buffer)
+    if len(view) <= len(MAGIC):
+        raise ValueError('the message is truncated')
+    if view[:len(MAGIC)] != MAGIC:
+        raise ValueError('the message is not framed')
+    if view[len(MAGIC)] != MESSAGE_VERSION:
+        raise ValueError(f'the message is framed in version {view[len(MAGIC)]}, not {MESSAGE_VERSION}')
+
+    fields, offset = encoding.decode(view, len(MAGIC) + 1, views=True)
+    if not isinstance(fields, list):
+        raise ValueError('a framed message holds a list of fields')
+    if offset != len(view):
+        raise ValueError('unexpected bytes after the fields of the message')
+
+    return fields
@@ -1,17 +1,26 @@
 import sys
 import os
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
 
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(parent_dir)
 
+import framing
 import python_blockchain
+import sync
 from cryptographie.code.src.encryption import *
 
 
+PARALLEL_MIN_MESSAGES = 32 # a message is one RSA decryption and one signature check: fewer are read in this process
+
+
 def request_info(minstd: int, requestObject: str, ipp: int, rpps: int, ip: str,
                  recipientPublicKey: object, senderPrivateKey: object) -> dict:
     """
     Give a dictionary with minstd and encrypted message.
+    The message is encrypted in an envelope (see hybridEncryption): its size is not limited by the RSA key. The fields
+    and the message are framed, see framing.frame.
 
     :param minstd: last minstd number generated
     :param requestObject: object of the request
@@ -24,44 +33,185 @@ def request_info(minstd: int, requestObject: str, ipp: int, rpps: int, ip: str,
     :rtype: dictionary
     """
 
-    data = f'{requestObject}*DEL*{ipp}*DEL*{rpps}*DEL*{ip}'
+    data = framing.frame([requestObject, ipp, rpps, ip])
     signature = RSASignature(data, senderPrivateKey)
-    message = asymmetricRSAEncryption(data.encode(), recipientPublicKey) + b"*SEP*" + signature
+    message = framing.frame([hybridEncryption(data, recipientPublicKey), signature])
 
     return {'minstd': minstd, 'data': message}
 
 
+def request_info_batch(requests: list, senderPrivateKey: object, workers=None) -> list:
+    """
+    Give the messages of many requests, like request_info called on each one.
+    The RSA work of the requests (signature and encryption) is shared between threads: the Crypto module releases the
+    GIL while computing.
+
+    :param requests: list of (minstd, requestObject, ipp, rpps, ip, recipientPublicKey), see request_info
+    :param senderPrivateKey: RSA private key of the sender, signing every request
+    :param workers: number of threads, the default of ThreadPoolExecutor if None
+    :return: dictionaries which serve as messages through the blockchain transactions, in the order of the requests
+    :rtype: list
+    """
+
+    with ThreadPoolExecutor(workers) as pool:
+        return list(pool.map(lambda request: request_info(*request, senderPrivateKey), requests))
+
+
+def _open_message(data: bytes, senderPublicKey: object, recipientPrivateKey: object) -> tuple:
+    """
+    Decrypt the given message, framed or in the former formats where the fields were separated by *DEL* and *SEP*.
+
+    :param data: given message
+    :param senderPublicKey: public key of the sender
+    :param recipientPrivateKey: private key of the recipient
+    :return: signed data and its signature, not checked yet: the decrypted frame, or the decrypted string of a message
+        in the former formats
+    :rtype: tuple[bytes or str, bytes]
+    :raise: ValueError if the message is not valid or can't be decrypted with the key
+    """
+    if framing.is_framed(data):
+        fields = framing.unframe(data)
+        if len(fields) != 2:
+            raise ValueError('a message holds the encrypted data and its signature')
+        encrypted, signatureReceived = fields
+        return hybridDecryption(encrypted, recipientPrivateKey), signatureReceived
+
+    # the signature is as long as the key of the sender: the separator may also appear in the encrypted bytes
+    signatureSize = senderPublicKey.size_in_bytes()
+    dataReceived, signatureReceived = data[:-signatureSize - len(b"*SEP*")], data[-signatureSize:]
+
+    if len(dataReceived) == recipientPrivateKey.size_in_bytes(): # former format, a single RSA block
+        dataReceived = asymmetricRSADecryption(dataReceived, recipientPrivateKey)
+    else:
+        dataReceived = hybridDecryption(dataReceived, recipientPrivateKey)
+
+    return dataReceived.decode(), signatureReceived
+
+
+def _message_fields(signed: object) -> list:
+    """
+    :param signed: signed data given by _open_message
+    :return: fields of the message
+    :rtype: list
+    """
+    if isinstance(signed, str):
+        return signed.split("*DEL*")
+
+    # the frame is read with views, only the bytes fields given back are copied: a key, a tag or a nonce
+    return [bytes(field) if isinstance(field, memoryview) else field for field in framing.unframe(signed)]
+
+
 def decrypt_info(data: bytes, senderPublicKey: object, recipientPrivateKey: object) -> list:
     """
-    Decrypt the given message.
+    Decrypt the given message, framed or in the former formats where the fields were separated by *DEL* and *SEP*.
 
     :param data: given message
     :param senderPublicKey: public key of the sender
     :param recipientPrivateKey: private key of the recipient
-    :return: decrypted message if valid signature, else value error
+    :return: fields of the decrypted message if valid signature (str, int or bytes; only str in the former formats),
+        else value error
     :rtype: list
     :raise: error if RSA signature isn't valid
     """
-    dataReceived, signatureReceived = data.split(b"*SEP*")
-    dataReceived = asymmetricRSADecryption(dataReceived, recipientPrivateKey)
-    dataReceived = dataReceived.decode()
+    dataReceived, signatureReceived = _open_message(data, senderPublicKey, recipientPrivateKey)
 
     try:
         verifyRSASignature(dataReceived, signatureReceived, senderPublicKey)
-        return dataReceived.split("*DEL*")
+        return _message_fields(dataReceived)
 
     except Exception as e:
         print(e)
         return [e]
 
 
+_recipient_key = None
+_sender_keys = None
+
+
+def _init_decrypt_worker(recipientKey: bytes, senderKeys: dict) -> None:
+    """
+    Initialization of a worker process of decrypt_inbox: the keys are imported once, not for each message
+
+    :param bytes recipientKey: private key of the recipient in PEM format
+    :param dict senderKeys: public keys of the senders in PEM format, by wallet
+    """
+
+    global _recipient_key, _sender_keys
+    _recipient_key = RSA.import_key(recipientKey)
+    _sender_keys = {wallet: RSA.import_key(key) for wallet, key in senderKeys.items()}
+
+
+def _decrypt_transaction(transaction: dict, senderPublicKeys: dict, recipientPrivateKey: object) -> object:
+    """
+    Decrypt and check the message of a transaction
+
+    :param transaction: transaction read in the blockchain
+    :param senderPublicKeys: RSA public keys of the senders, by wallet
+    :param recipientPrivateKey: RSA private key of the recipient
+    :return: decrypted message, or the error which stopped its decryption or its check
+    :rtype: list or Exception
+    """
+
+    try:
+        senderPublicKey = senderPublicKeys.get(transaction['sender'])
+        if senderPublicKey is None:
+            raise KeyError(f"no public key for the sender {transaction['sender']}")
+
+        dataReceived, signatureReceived = _open_message(transaction['message']['data'], senderPublicKey,
+                                                        recipientPrivateKey)
+        verifyRSASignature(dataReceived, signatureReceived, senderPublicKey)
+
+    except Exception as e:
+        return e
+
+    return _message_fields(dataReceived)
+
+
+def _decrypt_in_worker(transaction: dict) -> object:
+    """
+    Worker side of decrypt_inbox, with the keys imported by _init_decrypt_worker
+
+    :param transaction: transaction read in the blockchain
+    :return: decrypted message, or the error which stopped its decryption or its check
+    :rtype: list or Exception
+    """
+
+    return _decrypt_transaction(transaction, _sender_keys, _recipient_key)
+
+
+def decrypt_inbox(transactions: list, senderPublicKeys: dict, recipientPrivateKey: object, workers=None) -> list:
+    """
+    Decrypt and check the messages of many transactions, like decrypt_info called on each one, split between
+    processes. A message which can't be decrypted or whose signature is invalid doesn't stop the others.
+
+    :param transactions: transactions read in the blockchain, see read_transaction
+    :param senderPublicKeys: RSA public keys of the senders, by wallet
+    :param recipientPrivateKey: RSA private key of the recipient
+    :param workers: number of processes, os.cpu_count() if None
+    :return: for each transaction in the same order, the decrypted message or the error which stopped it
+    :rtype: list
+    """
+
+    if len(transactions) < PARALLEL_MIN_MESSAGES:
+        return [_decrypt_transaction(transaction, senderPublicKeys, recipientPrivateKey)
+                for transaction in transactions]
+
+    # the keys can't be pickled, they are sent to each worker once in PEM format
+    recipientKey = recipientPrivateKey.export_key()
+    senderKeys = {wallet: key.export_key() for wallet, key in senderPublicKeys.items()}
+
+    workers = workers or mp.cpu_count()
+    with mp.Pool(workers, initializer=_init_decrypt_worker, initargs=(recipientKey, senderKeys)) as pool:
+        return pool.map(_decrypt_in_worker, transactions, chunksize=-(-len(transactions) // (4 * workers)))
+
+
 def send_symmetric_key(minstd: int, symmetricKey: object, tag: bytes, nonce: bytes,
                        recipientPublicKey: object, senderPrivateKey: object) -> dict:
     """
-    Message format to send symmetric key of the file, asymmetrically encrypted.
+    Message format to send symmetric key of the file, encrypted in an envelope and framed like request_info.
 
     :param minstd: minstd
-    :param symmetricKey: symmetric key to send
+    :param symmetricKey: symmetric key to send, bytes or str
     :param tag: tag needed for decryption
     :param nonce: nonce needed for decryption
     :param recipientPublicKey: public key of the recipient
@@ -69,9 +219,9 @@ def send_symmetric_key(minstd: int, symmetricKey: object, tag: bytes, nonce: byt
     :return: dictionary which serves as message through the blockchain transaction
     :rtype: dictionary
     """
-    data = f'retour*DEL*{symmetricKey}*DEL*{tag}*DEL*{nonce}'
+    data = framing.frame(['retour', symmetricKey, tag, nonce])
     signature = RSASignature(data, senderPrivateKey)
-    message = asymmetricRSAEncryption(data.encode(), recipientPublicKey) + b"*SEP*" + signature
+    message = framing.frame([hybridEncryption(data, recipientPublicKey), signature])
 
     return {'minstd': minstd, 'data': message}
 
@@ -95,34 +245,124 @@ def send_transaction(blockchain: object, sender: str, recipient: str, quantity:
     blockchain.block_mining(sender)
 
 
-def read_transaction(stored_blockchain: object, new_blockchain:object, address: str) -> (object, list):
+def mine_transaction(miner: object, sender: str, recipient: str, quantity: float, data: object) -> object:
+    """
+    Send a transaction like send_transaction, without waiting for the proof of work.
+
+    :param miner: mining.BackgroundMiner of the blockchain where we have to have the transaction
+    :param sender: wallet of the sender
+    :param recipient: wallet of the recipient
+    :param quantity: quantity to send
+    :param data: data to send
+    :return: future of the block holding the transaction, future.cancel() abandons it
+    """
+    miner.blockchain.new_data(
+        sender=sender,
+        recipient=recipient,
+        quantity=quantity,
+        message=data)
+
+    return miner.submit(sender)
+
+
+def queue_transaction(blockchain: object, sender: str, recipient: str, quantity: float, data: object,
+                      priority=0) -> object:
+    """
+    Queue a transaction in the mempool of the blockchain; the sealer thread of the blockchain mines the block once
+    enough messages are waiting, or once the oldest one has waited max_age seconds. The caller doesn't wait for the
+    proof of work.
+
+    :param blockchain: blockchain where we have to have the transaction
+    :param sender: wallet of the sender
+    :param recipient: wallet of the recipient
+    :param quantity: quantity to send
+    :param data: data to send
+    :param priority: the higher, the sooner the transaction is put in a block
+    :return: handle to wait until the transaction is in a block
+    """
+    handle = blockchain.submit_data(
+        sender=sender,
+        recipient=recipient,
+        quantity=quantity,
+        message=data,
+        priority=priority)
+
+    blockchain.start_sealer(sender).wake()
+    return handle
+
+
+def _newest_first(found: list) -> list:
+    """
+    :param list found: list of (height, position, transaction)
+    :return: the transactions, newest block first, in block order within one
+    """
+    found.sort(key=lambda entry: (-entry[0], entry[1]))
+    return [tx for height, position, tx in found]
+
+
+def _last_position(found: list) -> tuple:
+    """
+    :param list found: list of (height, position, transaction), in chain order
+    :return: (height, position) of the last transaction, to give to InboxCursor.acknowledge once they are all handled;
+        None if there is none
+    """
+    return found[-1][:2] if found else None
+
+
+def read_transaction(stored_blockchain: object, new_blockchain:object, address: str, cursor=None) -> (object, list):
     """
     Read new transaction between stored and new blockchains given
 
     :param stored_blockchain: old blockchain stored locally
     :param new_blockchain: new blockchain, which may have changed if a new transaction was added
     :param address: wallet of the transaction sender
-    :return: new blockchain and list of new transactions
+    :param cursor: inbox.InboxCursor of this node: the transactions after the last one acknowledged are returned, even
+        after a restart, instead of comparing the lengths of the blockchains. The cursor is not moved: once the
+        transactions are handled, the caller gives the position returned to cursor.acknowledge
+    :return: new blockchain and list of new transactions; with a cursor, also the (height, position) to acknowledge,
+        None if there is no new transaction
     """
+    if cursor is not None:
+        found = cursor.poll(new_blockchain, address)
+        last = _last_position(found)
+        return (new_blockchain, _newest_first(found), last)
+
     diff = len(new_blockchain.chain) - len(stored_blockchain.chain)
-    L = []
 
     if diff != 0:
-        for i in range(1, diff + 1):
-            block = new_blockchain.chain[-i]
-            for tx in block.data:
-                if tx['recipient'] == address:
-                    L.append(tx)
-
+        start_height = len(new_blockchain.chain) - diff
     else:  # another transaction in the same block
-        block = new_blockchain.chain[-1]
-        for tx in block.data:
-            if tx['recipient'] == address:
-                L.append(tx)
+        start_height = len(new_blockchain.chain) - 1
+
+    # only the transactions of the address are read, from the index: newest block first, in block order within one
+    L = _newest_first(new_blockchain.transactions_to(address, start_height))
 
     return (new_blockchain, L)
 
 
+def sync_transactions(blockchain: object, transport: object, address: str, cursor=None) -> list:
+    """
+    Bring the local blockchain up to date with another node, then read the new transactions for the address.
+    Only the headers and the missing blocks are exchanged, instead of a whole copy of the other blockchain.
+
+    :param blockchain: blockchain stored locally, updated in place
+    :param transport: sync.LocalTransport or sync.SocketTransport to the other node
+    :param address: wallet of the transaction recipient
+    :param cursor: inbox.InboxCursor of this node: the transactions after the last one acknowledged are returned,
+        instead of those of the blocks received; like for read_transaction, the cursor is not moved
+    :return: list of new transactions, newest block first; with a cursor, also the (height, position) to acknowledge
+    """
+    start_height = sync.sync(blockchain, transport)
+    if cursor is not None:
+        found = cursor.poll(blockchain, address)
+        last = _last_position(found)
+        return _newest_first(found), last
+    elif start_height is None:
+        return []
+
+    return _newest_first(blockchain.transactions_to(address, start_height))
+
+
 def last_minstd(blockchain: object) -> int:
     """
     Find last minstd stored in the given blockchain.
@@ -130,11 +370,11 @@ def last_minstd(blockchain: object) -> int:
     :param blockchain: blockchain where minstd is to find
     :return: last minstd stored in the given blockchain
     """
-    for i in range(1, len(blockchain.chain) + 1):
-        for j in range(1, len(blockchain.chain[-i].data) + 1):
-            mess = blockchain.chain[-i].data[-j]['message']
-            if type(mess) == dict:
-                return mess['minstd']
+    if blockchain.latest_minstd is None:
+        return None
+
+    height, position = blockchain.latest_minstd
+    return blockchain.chain[height].transaction(position)['message']['minstd']
 
 
 if __name__ == '__main__':
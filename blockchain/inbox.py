@@ -0,0 +1,158 @@
+"""
+Inbox cursors: the position of the last transaction each address has acknowledged, saved in a file so that a node
+restarted later only reads the messages received since. A poll looks up the address index after the cursor, its cost
+only depends on the number of new messages.
+A cursor also keeps the hash of its block and of a few blocks before: if the chain was reorganised under it, the poll
+starts again after the last of them still in the chain, and the messages of the replaced blocks are read again.
+"""
+
+
+import os
+from hashlib import sha256
+
+import encoding
+import sync
+from python_blockchain import Blockchain, header_bytes
+
+
+CURSOR_VERSION = 2
+
+
+def _block_hash(chain: object, height: int) -> bytes:
+    """
+    :param chain: list of the blocks, ChainStore or SnapshotChain
+    :param int height: height of a block
+    :return: the raw hash of the block, None if the chain is shorter
+    :rtype: bytes
+    """
+
+    if height >= len(chain):
+        return None
+
+    return sha256(header_bytes(chain, height)).digest()
+
+
+
+class InboxCursor:
+    """
+    Cursors of the addresses read on a node, saved in a file at each acknowledgement.
+    The messages are read with poll, then acknowledged with acknowledge once they are handled: a message polled but
+    not acknowledged before a restart is polled again.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Initialization of the InboxCursor class
+
+        :param str path: path of the file of the cursors, read if it exists
+        :raise: ValueError if the file is not a file of cursors
+        """
+
+        self.path = path
+        self.positions = {} # address -> (height, position) of the last transaction acknowledged
+        # address -> [(height, raw block hash)] from the height of the cursor down to 0, see sync.locator
+        self.hashes = {}
+
+        if os.path.exists(path):
+            with open(path, 'rb') as file:
+                saved, _ = encoding.decode(file.read())
+            if not isinstance(saved, dict) or saved.get('version') != CURSOR_VERSION:
+                raise ValueError(f'{path} is not a file of inbox cursors of version {CURSOR_VERSION}')
+            for address, (height, position, hashes) in saved['positions'].items():
+                self.positions[address] = (height, position)
+                self.hashes[address] = [tuple(entry) for entry in hashes]
+
+
+    def position(self, address: str) -> tuple:
+        """
+        :param str address: wallet
+        :return: (height, position) of the last transaction acknowledged by the address, None if there is none
+        :rtype: tuple[int, int]
+        """
+
+        return self.positions.get(address)
+
+
+    def _start(self, blockchain: Blockchain, address: str) -> tuple:
+        """
+        Where the poll of an address starts: just after its cursor if the block of the cursor is still in the chain,
+        otherwise after the last block before it still there
+
+        :param Blockchain blockchain: blockchain read
+        :param str address: wallet
+        :return: (height, position) of the first transaction to read
+        :rtype: tuple[int, int]
+        """
+
+        position = self.positions.get(address)
+        if position is None:
+            return 0, 0
+
+        height, index = position
+        hashes = self.hashes[address]
+        # only the block of the cursor is hashed while the chain was not reorganised under it
+        if _block_hash(blockchain.chain, height) == hashes[0][1]:
+            return height, index + 1
+
+        for fork_height, block_hash in hashes[1:]:
+            if _block_hash(blockchain.chain, fork_height) == block_hash:
+                return fork_height + 1, 0
+
+        return 0, 0
+
+
+    def poll(self, blockchain: Blockchain, address: str) -> list:
+        """
+        Transactions received by an address after its cursor, found with the recipient index of the blockchain.
+        If the block of the cursor was replaced, the transactions after the last block still in the chain are returned
+        again, whether they were acknowledged or not.
+
+        :param Blockchain blockchain: blockchain read
+        :param str address: wallet of the recipient
+        :return: list of (height, position, transaction), in chain order
+        :rtype: list[tuple[int, int, dict]]
+        :raise: LookupError if a transaction is in a pruned block, see snapshot.prune
+        """
+
+        return blockchain.transactions_to(address, *self._start(blockchain, address))
+
+
+    def acknowledge(self, blockchain: Blockchain, address: str, height: int, position: int) -> None:
+        """
+        Move the cursor of an address after a transaction and save the cursors.
+        Acknowledging a transaction the cursor is already past does nothing, unless the block of the cursor was
+        replaced by a reorganisation of the chain.
+
+        :param Blockchain blockchain: blockchain the transaction was polled from
+        :param str address: wallet
+        :param int height: height of the last transaction handled
+        :param int position: its position in its block
+        """
+
+        if self.positions.get(address) is not None and self._start(blockchain, address) > (height, position):
+            return
+
+        # sync.locator only needs the length of the chain
+        heights = sync.locator(range(height + 1))
+        self.positions[address] = (height, position)
+        self.hashes[address] = [(h, _block_hash(blockchain.chain, h)) for h in heights]
+        self.save()
+
+
+    def save(self) -> None:
+        """
+        Write the cursors to their file, replacing it only once the new one is complete
+        """
+
+        saved = encoding.encode({
+            'version': CURSOR_VERSION,
+            'positions': {address: [height, position, [list(entry) for entry in self.hashes[address]]]
+                          for address, (height, position) in self.positions.items()},
+        })
+
+        temporary = self.path + '.tmp'
+        with open(temporary, 'wb') as file:
+            file.write(saved)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.path)
@@ -0,0 +1,295 @@
+"""
+Pool of the transactions waiting for a block: they are gathered so that one proof of work confirms many of them.
+A Sealer thread seals them as soon as a block is due.
+"""
+
+
+import heapq
+import threading
+from itertools import count
+from time import time
+
+
+class TxHandle:
+    """
+    Handle given back for a pending transaction, to wait until it is in a block
+    """
+
+    def __init__(self, tx: dict) -> None:
+        """
+        :param dict tx: the pending transaction
+        """
+
+        self.tx = tx
+        self.height = None   # index of the block holding the transaction, once confirmed
+        self.position = None # position of the transaction in this block
+        self.dropped = False # True if the transaction was pushed out of a full pool
+        self._entry = None   # place of the transaction in the pool, kept to put it back there, see Mempool.put_back
+        self._event = threading.Event()
+
+
+    def _confirm(self, height: int, position: int) -> None:
+        """
+        Mark the transaction as confirmed and wake up the waiting callers
+
+        :param int height: index of the block holding the transaction
+        :param int position: position of the transaction in the block
+        """
+
+        self.height = height
+        self.position = position
+        self._event.set()
+
+
+    def _drop(self) -> None:
+        """
+        Mark the transaction as dropped from the pool and wake up the waiting callers
+        """
+
+        self.dropped = True
+        self._event.set()
+
+
+    @property
+    def confirmed(self) -> bool:
+        """
+        :return: True if the transaction is in a block
+        :rtype: bool
+        """
+
+        return self.height is not None
+
+
+    def wait(self, timeout=None) -> bool:
+        """
+        Block until the transaction is confirmed
+
+        :param float timeout: maximum time to wait in seconds, None to wait for ever
+        :return: True if the transaction is confirmed, False if the timeout expired or if it was dropped
+        :rtype: bool
+        """
+
+        return self._event.wait(timeout) and self.confirmed
+
+
+    def __repr__(self) -> str:
+        state = f'confirmed in block {self.height}' if self.confirmed else 'dropped' if self.dropped else 'pending'
+        return f'TxHandle({self.tx["sender"]} -> {self.tx["recipient"]}, {state})'
+
+
+
+class Mempool:
+    """
+    Bounded pool of pending transactions, taken by decreasing priority then by arrival order.
+    A block is due when enough transactions are waiting, or when the oldest one has waited long enough.
+    """
+
+    def __init__(self, capacity=10000, block_size=500, max_age=5.0) -> None:
+        """
+        Initialization of the Mempool class
+
+        :param int capacity: maximum number of pending transactions
+        :param int block_size: number of transactions which makes a block due, and maximum taken for one block
+        :param float max_age: waiting time in seconds of the oldest transaction which makes a block due
+        """
+
+        self.capacity = capacity
+        self.block_size = block_size
+        self.max_age = max_age
+        self._heap = []         # (-priority, arrival number, arrival time, handle)
+        self._oldest = None     # arrival time of the oldest pending transaction
+        self._arrivals = count()
+        self._lock = threading.Lock()
+
+
+    def __getstate__(self) -> dict:
+        # the lock and the handles stay in this process, only the pending transactions are kept
+        pending = [(-priority, arrival, handle.tx) for priority, _, arrival, handle in sorted(self._heap)]
+        return {'capacity': self.capacity, 'block_size': self.block_size, 'max_age': self.max_age, 'pending': pending}
+
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state['capacity'], state['block_size'], state['max_age'])
+        self._heap = [(-priority, next(self._arrivals), arrival, TxHandle(tx))
+                      for priority, arrival, tx in state['pending']]
+        for entry in self._heap:
+            entry[3]._entry = entry
+        heapq.heapify(self._heap)
+        self._update_oldest()
+
+
+    def _update_oldest(self) -> None:
+        """
+        Find again the arrival time of the oldest pending transaction, after some were removed
+        """
+
+        self._oldest = min((arrival for _, _, arrival, _ in self._heap), default=None)
+
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+
+    def add(self, tx: dict, priority=0) -> TxHandle:
+        """
+        Add a transaction to the pool
+
+        :param dict tx: transaction, as built by Blockchain.new_data
+        :param int priority: the higher, the sooner the transaction is put in a block
+        :return: handle to wait for the confirmation
+        :rtype: TxHandle
+        :raise: ValueError if the pool is full of transactions with a priority at least as high
+        """
+
+        handle = TxHandle(tx)
+        entry = handle._entry = (-priority, next(self._arrivals), time(), handle)
+
+        with self._lock:
+            if len(self._heap) >= self.capacity:
+                lowest = max(self._heap)
+                if lowest <= entry:
+                    raise ValueError(f'the mempool is full ({self.capacity} pending transactions)')
+                # the new transaction takes the place of the least urgent one
+                self._heap.remove(lowest)
+                heapq.heapify(self._heap)
+                self._update_oldest()
+                lowest[3]._drop()
+
+            heapq.heappush(self._heap, entry)
+            if self._oldest is None:
+                self._oldest = entry[2]
+
+        return handle
+
+
+    def due(self, now=None) -> bool:
+        """
+        Tell if a block should be sealed
+
+        :param float now: current time, time() if None
+        :return: True if block_size transactions are waiting or if the oldest one is older than max_age
+        :rtype: bool
+        """
+
+        with self._lock:
+            if len(self._heap) >= self.block_size:
+                return True
+
+            now = time() if now is None else now
+            return self._oldest is not None and now - self._oldest >= self.max_age
+
+
+    def take(self, limit=None) -> list:
+        """
+        Remove the most urgent transactions from the pool
+
+        :param int limit: maximum number of transactions, block_size if None
+        :return: handles of the transactions, in the order they must be put in the block
+        :rtype: list[TxHandle]
+        """
+
+        limit = self.block_size if limit is None else limit
+
+        with self._lock:
+            handles = [heapq.heappop(self._heap)[3] for _ in range(min(limit, len(self._heap)))]
+            self._update_oldest()
+
+        return handles
+
+
+    def put_back(self, handles: list) -> None:
+        """
+        Put transactions taken for a block which could not be made back in the pool, at their former place; the pool
+        may hold more than capacity transactions for a while
+
+        :param list handles: handles given by take
+        """
+
+        with self._lock:
+            for handle in handles:
+                heapq.heappush(self._heap, handle._entry)
+            self._update_oldest()
+
+
+
+class Sealer:
+    """
+    Thread sealing the pending transactions of a blockchain as soon as a block is due: a transaction left alone in the
+    pool is put in a block once it is max_age old, without waiting for other transactions to come.
+    """
+
+    def __init__(self, blockchain: object, miner_details: str, workers=1, interval=None) -> None:
+        """
+        Initialization of the Sealer class, the thread is started
+
+        :param Blockchain blockchain: blockchain whose mempool is sealed
+        :param str miner_details: details of the miner of the blocks
+        :param int workers: number of processes sharing the proof of work
+        :param float interval: time in seconds between two checks of the pool, a tenth of max_age if None
+        """
+
+        self.blockchain = blockchain
+        self.miner_details = miner_details
+        self.workers = workers
+        self.interval = interval if interval is not None else blockchain.mempool.max_age / 10
+        self.error = None # last error met while sealing, the transactions were put back in the pool
+        self._closed = threading.Event()
+        self._woken = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='mempool-sealer', daemon=True)
+        self._thread.start()
+
+
+    def _run(self) -> None:
+        """
+        Thread side of the sealer: check the pool at each interval until closed
+        """
+
+        while True:
+            self._woken.wait(self.interval)
+            self._woken.clear()
+            if self._closed.is_set():
+                return
+            try:
+                # a full pool may need several blocks
+                while self.blockchain.seal_pending(self.miner_details, workers=self.workers) is not None:
+                    if self._closed.is_set():
+                        return
+            except Exception as error:
+                self.error = error # tried again at the next interval
+
+
+    def wake(self) -> None:
+        """
+        Check the pool now instead of at the end of the interval, after a transaction was added
+        """
+
+        self._woken.set()
+
+
+    @property
+    def running(self) -> bool:
+        """
+        :return: True until the sealer is closed
+        :rtype: bool
+        """
+
+        return self._thread.is_alive() and not self._closed.is_set()
+
+
+    def close(self) -> None:
+        """
+        Stop the thread, after the block being sealed if any
+        """
+
+        self._closed.set()
+        self._woken.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+
+
+    def __enter__(self) -> 'Sealer':
+        return self
+
+
+    def __exit__(self, *exc) -> None:
+        self.close()
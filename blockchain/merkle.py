@@ -0,0 +1,144 @@
+"""
+Merkle tree over the transactions of a block.
+A block header only commits to the root, so one transaction can be checked with O(log n) hashes instead of the whole
+data of the block.
+"""
+
+
+from hashlib import sha256
+
+import encoding
+
+
+LEAF, NODE = b'\x00', b'\x01' # prefixes keeping a leaf from ever being taken for an inner node
+EMPTY_ROOT = sha256(b'').digest()
+
+
+def leaf_hash(tx: object) -> bytes:
+    """
+    Hash of one transaction, fed with its binary encoding
+
+    :param object tx: transaction
+    :return: the hash of the leaf
+    :rtype: bytes
+    """
+
+    hash_object = sha256(LEAF)
+    for chunk in encoding.encode_chunks(tx):
+        hash_object.update(chunk)
+
+    return hash_object.digest()
+
+
+def encoded_leaf_hash(raw: bytes) -> bytes:
+    """
+    Hash of one transaction already encoded, same as leaf_hash
+
+    :param bytes raw: binary encoding of the transaction
+    :return: the hash of the leaf
+    :rtype: bytes
+    """
+
+    return sha256(LEAF + raw).digest()
+
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    """
+    Hash of an inner node
+
+    :param bytes left: hash of the left child
+    :param bytes right: hash of the right child
+    :return: the hash of the node
+    :rtype: bytes
+    """
+
+    return sha256(NODE + left + right).digest()
+
+
+def build_levels(data: list) -> list:
+    """
+    Build every level of the tree over the given transactions
+
+    :param list data: transactions
+    :return: the levels of the tree, the last one holding only the root
+    :rtype: list[list[bytes]]
+    """
+
+    return build_levels_from_leaves([leaf_hash(tx) for tx in data])
+
+
+def build_levels_from_leaves(leaves: list) -> list:
+    """
+    Build every level of the tree, from the leaves to the root.
+    A node without sibling is moved up as it is, it is never paired with a copy of itself.
+
+    :param list leaves: hashes of the leaves
+    :return: the levels of the tree, the last one holding only the root
+    :rtype: list[list[bytes]]
+    """
+
+    level = leaves or [EMPTY_ROOT]
+    levels = [level]
+
+    while len(level) > 1:
+        level = [node_hash(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+                 for i in range(0, len(level), 2)]
+        levels.append(level)
+
+    return levels
+
+
+def merkle_root(data: list) -> bytes:
+    """
+    Root of the tree over the given transactions
+
+    :param list data: transactions
+    :return: the root
+    :rtype: bytes
+    """
+
+    return build_levels(data)[-1][0]
+
+
+def build_proof(levels: list, position: int) -> list:
+    """
+    Inclusion proof of a transaction: the sibling hashes on the way from its leaf to the root
+
+    :param list levels: levels of the tree, given by build_levels
+    :param int position: position of the transaction in the block
+    :return: list of (True if the sibling is on the left, sibling hash)
+    :rtype: list[tuple[bool, bytes]]
+    :raise: IndexError if there is no transaction at this position
+    """
+
+    # the tree of a block without transactions holds only the EMPTY_ROOT placeholder, which is not a leaf
+    leaves = 0 if levels == [[EMPTY_ROOT]] else len(levels[0])
+    if not 0 <= position < leaves:
+        raise IndexError(f'no transaction at position {position}')
+
+    proof = []
+    for level in levels[:-1]:
+        sibling = position ^ 1
+        if sibling < len(level):
+            proof.append((sibling < position, level[sibling]))
+        position //= 2
+
+    return proof
+
+
+def verify_proof(tx: object, proof: list, root: bytes) -> bool:
+    """
+    Check that a transaction is in the tree of the given root
+
+    :param object tx: transaction
+    :param list proof: inclusion proof given by build_proof
+    :param bytes root: merkle root of the block header
+    :return: True if the transaction is included, False otherwise
+    :rtype: bool
+    """
+
+    current = leaf_hash(tx)
+    for on_left, sibling in proof:
+        current = node_hash(sibling, current) if on_left else node_hash(current, sibling)
+
+    return current == root
@@ -0,0 +1,217 @@
+"""
+Multi-core proof of work: the nonce space is cut into chunks which are searched by a pool of processes
+"""
+
+
+import multiprocessing as mp
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from pow_engine import MidstateEngine
+
+
+CHUNK_SIZE = 20000 # nonces searched by a worker before it comes back for a new chunk
+
+
+_stop_event = None
+
+
+def _init_worker(stop_event: object) -> None:
+    """
+    Initialization of a worker process, keeping the shared stop event
+
+    :param multiprocessing.Event stop_event: event set by the parent process when a nonce was found
+    """
+
+    global _stop_event
+    _stop_event = stop_event
+
+
+def search_chunk(engine: object, last_nonce: int, bits: int, start: int, stop: int) -> int:
+    """
+    Look for the smallest nonce in [start, stop[ satisfying the proof, same test as Blockchain.verify_proof
+
+    :param PowEngine engine: proof of work engine doing the search
+    :param int last_nonce: previous nonce
+    :param int bits: number of zero bits required at the beginning of the hash
+    :param int start: first nonce of the chunk
+    :param int stop: end of the chunk (excluded)
+    :return: the nonce found, None if there is none in the chunk or if the search was stopped
+    :rtype: int
+    """
+
+    return engine.search(last_nonce, bits, start, stop, _stop_event)
+
+
+
+class ParallelMiner:
+    """
+    Pool of processes sharing the search of a nonce.
+    The chunks are collected in order, so the nonce returned is the smallest valid one, exactly like the single core
+    loop of Blockchain.proof_of_work.
+    """
+
+    def __init__(self, workers=None, chunk_size=CHUNK_SIZE, engine=None) -> None:
+        """
+        Initialization of the ParallelMiner class
+
+        :param int workers: number of processes, os.cpu_count() if None
+        :param int chunk_size: number of nonces searched by a worker at once
+        :param PowEngine engine: proof of work engine used by the workers, MidstateEngine if None
+        """
+
+        self.workers = workers or mp.cpu_count()
+        self.chunk_size = chunk_size
+        self.engine = engine or MidstateEngine()
+        self._stop_event = mp.Event()
+        self._pool = mp.Pool(self.workers, initializer=_init_worker, initargs=(self._stop_event,))
+
+
+    def search(self, last_nonce: int, bits: int, abort=None) -> int:
+        """
+        Find the smallest nonce satisfying the proof for the given last nonce
+
+        :param int last_nonce: previous nonce
+        :param int bits: number of zero bits required at the beginning of the hash
+        :param abort: function called each time a chunk is done, the search is abandoned when it returns True
+        :return: nonce, None if the search was abandoned
+        :rtype: int
+        """
+
+        self._stop_event.clear()
+        window = 2 * self.workers # chunks queued at the same time, to keep every worker busy
+        pending = []
+        next_chunk = 0
+        nonce = None
+
+        try:
+            while nonce is None:
+                while len(pending) < window:
+                    start = next_chunk * self.chunk_size
+                    pending.append(self._pool.apply_async(
+                        search_chunk, (self.engine, last_nonce, bits, start, start + self.chunk_size)))
+                    next_chunk += 1
+
+                # the oldest chunk holds the smallest nonces: once it is done, the result can't be beaten
+                nonce = pending.pop(0).get()
+                if nonce is None and abort is not None and abort():
+                    return None
+
+        finally:
+            self._stop_event.set()
+            for result in pending:
+                result.wait()
+
+        return nonce
+
+
+    def close(self) -> None:
+        """
+        Stop the worker processes
+        """
+
+        self._pool.terminate()
+        self._pool.join()
+
+
+    def __enter__(self) -> 'ParallelMiner':
+        return self
+
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+
+class BackgroundMiner:
+    """
+    Mines the blocks of a blockchain without blocking the caller: each request gives back a future of the block.
+    The proof of work runs in worker processes; when another block reaches the chain meanwhile (a synchronisation or
+    another miner), the search starts again on the new last block instead of finishing a proof which is no longer valid.
+    """
+
+    def __init__(self, blockchain: object, workers=1, chunk_size=CHUNK_SIZE) -> None:
+        """
+        Initialization of the BackgroundMiner class
+
+        :param Blockchain blockchain: blockchain the blocks are added to
+        :param int workers: number of processes sharing the proof of work, None to use every core
+        :param int chunk_size: number of nonces searched by a worker at once, the delay to notice a new last block
+        """
+
+        self.blockchain = blockchain
+        self._miner = ParallelMiner(workers, chunk_size, blockchain.pow_engine)
+        self._thread = ThreadPoolExecutor(1) # the blocks are mined one after the other
+        self._closed = threading.Event()
+
+
+    def submit(self, miner_details: str) -> Future:
+        """
+        Ask for a new block, mined with the data waiting in the blockchain when the proof is found
+
+        :param str miner_details: details of the miner
+        :return: future of the new block; future.cancel() abandons the proof of work
+        :rtype: concurrent.futures.Future
+        """
+
+        future = Future()
+        self._thread.submit(self._mine, future, miner_details)
+        return future
+
+
+    def _mine(self, future: Future, miner_details: str) -> None:
+        """
+        Background side of submit: look for a proof on the last block until one is found on a block still last
+
+        :param Future future: future of the new block, still pending until the block is added
+        :param str miner_details: details of the miner
+        """
+
+        blockchain = self.blockchain
+        try:
+            while not (future.cancelled() or self._closed.is_set()):
+                with blockchain.lock:
+                    last_block = blockchain.last_block
+                    last_hash = last_block.hash_calculation
+                    bits = blockchain.bits_at(last_block.index + 1)
+
+                tip_changed = lambda: blockchain.last_block.hash_calculation != last_hash
+                abort = lambda: future.cancelled() or self._closed.is_set() or tip_changed()
+                nonce = self._miner.search(last_block.nonce, bits, abort)
+
+                with blockchain.lock:
+                    if nonce is None or tip_changed():
+                        continue # cancelled, or a new last block: the loop starts again on it
+                    if not future.set_running_or_notify_cancel():
+                        return
+                    blockchain.new_data(
+                        sender='0', # chosen value 0 for a new block
+                        recipient=miner_details,
+                        quantity=1, # arbitrary value of 1
+                        message='***Mining new block***')
+                    future.set_result(blockchain.add_block(nonce, last_hash))
+                    return
+
+            future.cancel()
+
+        except Exception as error:
+            if future.running() or future.set_running_or_notify_cancel():
+                future.set_exception(error)
+
+
+    def close(self) -> None:
+        """
+        Abandon the blocks being mined and stop the worker processes
+        """
+
+        self._closed.set()
+        self._thread.shutdown(wait=True)
+        self._miner.close()
+
+
+    def __enter__(self) -> 'BackgroundMiner':
+        return self
+
+
+    def __exit__(self, *exc) -> None:
+        self.close()
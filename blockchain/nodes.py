@@ -0,0 +1,266 @@
+"""
+Peers of a node and resolution of conflicts between their chains: every registered peer is asked for its chain at the
+same time, and the valid chain with the most work is adopted, only its blocks after the last common height being
+fetched and checked.
+"""
+
+
+import asyncio
+from collections import deque
+
+import encoding
+import sync
+from python_blockchain import Blockchain
+
+
+PEER_TIMEOUT = 2.0 # seconds given to a peer for each request
+
+
+class LocalPeer:
+    """
+    Peer in the same process, standing in for another node: its blockchain is served by a sync.ChainServer
+    """
+
+    def __init__(self, blockchain: Blockchain, delay=0.0) -> None:
+        """
+        :param Blockchain blockchain: blockchain of the peer
+        :param float delay: time in seconds taken by each answer, to play a slow or unreachable node
+        """
+
+        self.server = sync.ChainServer(blockchain)
+        self.delay = delay
+        self._answers = deque()
+
+
+    async def open(self) -> None:
+        pass
+
+
+    async def send(self, request: dict) -> None:
+        self._answers.append(self.server.handle(request))
+
+
+    async def receive(self) -> object:
+        await asyncio.sleep(self.delay)
+        return self._answers.popleft()
+
+
+    async def close(self) -> None:
+        self._answers.clear()
+
+
+
+class SocketPeer:
+    """
+    Peer reached on a socket, served by sync.serve
+    """
+
+    def __init__(self, address: str) -> None:
+        """
+        :param str address: 'host:port' of the peer
+        """
+
+        host, port = address.rsplit(':', 1)
+        self.address = (host, int(port))
+        self._reader = self._writer = None
+
+
+    async def open(self) -> None:
+        self._reader, self._writer = await asyncio.open_connection(*self.address)
+
+
+    async def send(self, request: dict) -> None:
+        payload = encoding.encode(request)
+        self._writer.write(encoding.LENGTH.pack(len(payload)) + payload)
+        await self._writer.drain()
+
+
+    async def receive(self) -> object:
+        size, = encoding.LENGTH.unpack(await self._reader.readexactly(encoding.LENGTH.size))
+        return encoding.decode(await self._reader.readexactly(size))[0]
+
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._reader = self._writer = None
+
+
+
+def peer_of(address: str, peer: object) -> object:
+    """
+    :param str address: address of a registered node
+    :param peer: peer registered with it, None for a node reached on a socket
+    :return: the peer to query
+    :rtype: LocalPeer or SocketPeer
+    """
+
+    return peer if peer is not None else SocketPeer(address)
+
+
+async def _ask(peer: object, request: dict, timeout: float) -> object:
+    """
+    :param peer: LocalPeer or SocketPeer
+    :param dict request: request of the sync protocol
+    :param float timeout: time given to the peer in seconds
+    :return: the answer of the peer
+    :rtype: object
+    :raise: asyncio.TimeoutError if the peer doesn't answer in time
+    """
+
+    await peer.send(request)
+    return await asyncio.wait_for(peer.receive(), timeout)
+
+
+async def _pipelined(peer: object, requests: list, timeout: float, window=sync.WINDOW):
+    """
+    Send the requests with up to window of them waiting for their answer, like sync._pipelined
+
+    :param peer: LocalPeer or SocketPeer
+    :param requests: requests to send, iterated as they are sent
+    :param float timeout: time given to the peer for each answer in seconds
+    :param int window: maximum number of requests in flight
+    :return: asynchronous generator of the answers, in the order of the requests
+    :rtype: async_generator
+    """
+
+    requests = iter(requests)
+    in_flight = 0
+    for request in requests:
+        await peer.send(request)
+        in_flight += 1
+        if in_flight == window:
+            break
+
+    while in_flight:
+        answer = await asyncio.wait_for(peer.receive(), timeout)
+        in_flight -= 1
+        for request in requests:
+            await peer.send(request)
+            in_flight += 1
+            break
+        yield answer
+
+
+async def _locate(peer: object, request: dict, timeout: float) -> tuple:
+    """
+    Ask a peer for its last height in common with the local chain, the length of its chain and the work of its blocks
+    after the common height
+
+    :param peer: LocalPeer or SocketPeer
+    :param dict request: locate request of the local chain
+    :param float timeout: time given to the peer in seconds
+    :return: (peer, common height, length of its chain, work claimed), None if the peer failed
+    :rtype: tuple
+    """
+
+    # any error, a malformed answer as much as a lost connection, only leaves this peer out
+    try:
+        await asyncio.wait_for(peer.open(), timeout)
+        answer = await _ask(peer, request, timeout)
+        common, length, work = answer['common'], answer['length'], answer['work']
+        if common is not None and not all(isinstance(value, int) for value in (common, length, work)):
+            raise ValueError('malformed locate answer')
+    except Exception:
+        await peer.close()
+        return None
+
+    if common is None:
+        await peer.close()
+        return None
+
+    return peer, common, length, work
+
+
+async def _fetch_suffix(peer: object, blockchain: Blockchain, common: int, length: int, work: int,
+                        timeout: float) -> list:
+    """
+    Fetch and check the headers then the blocks of a peer after the last common height
+
+    :param peer: LocalPeer or SocketPeer
+    :param Blockchain blockchain: local blockchain
+    :param int common: last common height
+    :param int length: length of the chain of the peer
+    :param int work: work of the blocks of the peer after the common height, as it claimed it
+    :param float timeout: time given to the peer for each request in seconds
+    :return: the blocks of the peer after the common height, sync.MAX_FETCH at most
+    :rtype: list[Block]
+    :raise: ValueError if a header or a block is invalid, or if the headers have less work than the peer claimed or
+        than the local blocks
+    """
+
+    headers = sync.context_headers(blockchain, common)
+    context = len(headers)
+    # the length comes from the peer: the blocks after MAX_FETCH are left to the next resolution
+    stop = min(length, common + 1 + sync.MAX_FETCH)
+    async for raw in _pipelined(peer, sync.batch_requests('headers', common + 1, stop, sync.HEADER_BATCH), timeout):
+        sync.check_headers(headers, raw, blockchain.retarget, blockchain.authority)
+
+    headers = headers[context:]
+    # the candidates are tried by the work they claim: a peer claiming more than it has would be tried too early
+    if stop == length and sync.headers_work(headers) < work:
+        raise ValueError('the headers of the peer have less work than it claimed')
+    if sync.headers_work(headers) <= blockchain.work_after(common):
+        raise ValueError('the chain of the peer does not have more work than the local one')
+
+    blocks = []
+    stop = common + 1 + len(headers)
+    async for bodies in _pipelined(peer, sync.batch_requests('bodies', common + 1, stop, sync.BODY_BATCH), timeout):
+        sync.check_bodies(bodies, headers, blocks)
+
+    if len(blocks) != len(headers):
+        raise ValueError('the peer did not send every block')
+
+    return blocks
+
+
+async def resolve_conflicts_async(blockchain: Blockchain, timeout=PEER_TIMEOUT) -> bool:
+    """
+    Ask every registered node for its chain at the same time, then adopt the valid one with the most work, see
+    retarget.work: a long chain of easy blocks doesn't win over a shorter one which took more work.
+    A node which doesn't answer in time, or sends anything invalid, is left out; if the chain with the most work is
+    invalid, the next one is tried.
+
+    :param Blockchain blockchain: local blockchain, its nodes are the peers asked
+    :param float timeout: time given to each peer for each request in seconds
+    :return: True if the local chain was replaced, False if it already has the most work of the valid ones
+    :rtype: bool
+    """
+
+    request = sync.locate_request(blockchain.chain)
+    peers = [peer_of(address, peer) for address, peer in blockchain.nodes.items()]
+    answers = await asyncio.gather(*(_locate(peer, request, timeout) for peer in peers))
+
+    # each peer shares the blocks up to its common height: it is ranked on the work it has after them, minus the work
+    # of the local blocks it would replace
+    candidates = sorted(((work - blockchain.work_after(common), peer, common, length, work)
+                         for peer, common, length, work in filter(None, answers)), key=lambda candidate: -candidate[0])
+    try:
+        for gain, peer, common, length, work in candidates:
+            if gain <= 0:
+                break
+            try:
+                blocks = await _fetch_suffix(peer, blockchain, common, length, work, timeout)
+                blockchain.replace_from(common + 1, blocks)
+                return True
+            except Exception:
+                # whatever the peer sent, failing to decode or to check its chain only leaves it out
+                continue
+        return False
+
+    finally:
+        for gain, peer, common, length, work in candidates:
+            await peer.close()
+
+
+def resolve_conflicts(blockchain: Blockchain, timeout=PEER_TIMEOUT) -> bool:
+    """
+    Consensus algorithm: the local chain is replaced by the valid chain of the registered nodes with the most work
+
+    :param Blockchain blockchain: local blockchain
+    :param float timeout: time given to each peer for each request in seconds
+    :return: True if the local chain was replaced, False otherwise
+    :rtype: bool
+    """
+
+    return asyncio.run(resolve_conflicts_async(blockchain, timeout))
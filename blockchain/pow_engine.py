@@ -0,0 +1,147 @@
+"""
+Proof of work engines: the kernels used to search and verify a nonce.
+The proof is the same for every engine: the sha256 of f'{last_nonce}{nonce}' starts with `bits` zero bits.
+"""
+
+
+from hashlib import sha256
+
+
+SUFFIX_DIGITS = 3 # the last digits of a nonce are taken from a precomputed table
+
+
+class PowEngine:
+    """
+    Base class of a proof of work engine
+    """
+
+    def verify(self, last_nonce: int, nonce: int, bits: int) -> bool:
+        """
+        Verify that the hash of last_nonce & nonce matches the difficulty
+
+        :param int last_nonce: previous nonce
+        :param int nonce: current nonce
+        :param int bits: number of zero bits required at the beginning of the hash
+        :return: True if the proof is valid, False otherwise
+        :rtype: bool
+        """
+
+        raise NotImplementedError
+
+
+    def search(self, last_nonce: int, bits: int, start=0, stop=None, stop_event=None) -> int:
+        """
+        Look for the smallest nonce in [start, stop[ satisfying the proof
+
+        :param int last_nonce: previous nonce
+        :param int bits: number of zero bits required at the beginning of the hash
+        :param int start: first nonce tested
+        :param int stop: end of the search (excluded), None to search until a nonce is found
+        :param stop_event: event checked regularly, the search is abandoned when it is set
+        :return: the nonce found, None if there is none or if the search was stopped
+        :rtype: int
+        """
+
+        raise NotImplementedError
+
+
+
+class HexdigestEngine(PowEngine):
+    """
+    Reference engine: rebuild the string, hash it and read the hex digest as a number for each attempt
+    """
+
+    def verify(self, last_nonce: int, nonce: int, bits: int) -> bool:
+        to_find = f'{last_nonce}{nonce}'.encode()
+        return int(sha256(to_find).hexdigest(), 16) >> (256 - bits) == 0
+
+
+    def search(self, last_nonce: int, bits: int, start=0, stop=None, stop_event=None) -> int:
+        nonce = start
+
+        while stop is None or nonce < stop:
+            if self.verify(last_nonce, nonce, bits):
+                return nonce
+
+            nonce += 1
+            if stop_event is not None and nonce % 1000 == 0 and stop_event.is_set():
+                return None
+
+        return None
+
+
+
+class MidstateEngine(PowEngine):
+    """
+    Default engine.
+    The sha256 state of the str(last_nonce) prefix, then of the leading digits of the nonce, is computed once and
+    copied for each attempt: only the last SUFFIX_DIGITS digits, read from a precomputed table, are hashed.
+    The target is tested on the raw digest: whole zero bytes, then a bound on the next byte.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initialization of the MidstateEngine class, with the tables of the nonce suffixes
+        """
+
+        self._block = 10**SUFFIX_DIGITS
+        self._padded = [f'{i:0{SUFFIX_DIGITS}d}'.encode() for i in range(self._block)]   # used after leading digits
+        self._unpadded = [str(i).encode() for i in range(self._block)]                    # nonces < 10**SUFFIX_DIGITS
+
+
+    def __reduce__(self) -> tuple:
+        # the tables are rebuilt rather than pickled when the engine is sent to a worker process
+        return self.__class__, ()
+
+
+    @staticmethod
+    def _target(bits: int) -> tuple:
+        """
+        Translate a difficulty in bits into a test on the raw digest
+
+        :param int bits: number of zero bits required at the beginning of the hash
+        :return: the zero bytes prefix, the index of the next byte and the bound it must stay under (None if unused)
+        :rtype: tuple[bytes, int, int]
+        """
+
+        full, rest = divmod(bits, 8)
+        return bytes(full), full, 1 << (8 - rest) if rest else None
+
+
+    def verify(self, last_nonce: int, nonce: int, bits: int) -> bool:
+        digest = sha256(f'{last_nonce}{nonce}'.encode()).digest()
+        zeros, full, bound = self._target(bits)
+        return digest.startswith(zeros) and (bound is None or digest[full] < bound)
+
+
+    def search(self, last_nonce: int, bits: int, start=0, stop=None, stop_event=None) -> int:
+        zeros, full, bound = self._target(bits)
+        block = self._block
+        prefix = sha256(str(last_nonce).encode())
+
+        high = start // block
+        while stop is None or high * block < stop:
+            if high:
+                midstate = prefix.copy()
+                midstate.update(str(high).encode())
+                table = self._padded
+            else:
+                midstate = prefix
+                table = self._unpadded
+
+            low = start - high * block if start > high * block else 0
+            end = block if stop is None or stop >= (high + 1) * block else stop - high * block
+            copy = midstate.copy
+
+            for i in range(low, end):
+                h = copy()
+                h.update(table[i])
+                digest = h.digest()
+                if digest.startswith(zeros) and (bound is None or digest[full] < bound):
+                    return high * block + i
+
+            high += 1
+            if stop_event is not None and stop_event.is_set():
+                return None
+
+        return None
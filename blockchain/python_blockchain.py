@@ -1,38 +1,560 @@
+import threading
 from time import time
 from hashlib import sha256
+from bisect import bisect_left
+from array import array
+
+import bloom
+import encoding
+import merkle
+from mining import ParallelMiner
+from mempool import Mempool, Sealer, TxHandle
+from pow_engine import MidstateEngine
+from arena import TxArena
+from retarget import Retarget, work
+from validation import PARALLEL_MIN_BLOCKS, check_link, check_blocks, check_blocks_parallel, context_start
+
+
+HEADER_BLOOM = encoding.HEADER.size - 69 # position of the number of hashes of the bloom filter in the packed header
+HEADER_PREV = encoding.HEADER.size - 64  # position of the previous hash
+HEADER_ROOT = encoding.HEADER.size - 32  # position of the merkle root
+NO_ROOT = bytes(32)                      # merkle root of a block not sealed yet, computed when needed
+ADDRESS_FIELDS = ('sender', 'recipient') # fields of a transaction put in the bloom filter of its block
+TIMESTAMP_STEP = 1e-3                    # seconds a new block is stamped after the last one at least
+
+
+def _unsealed_header(header: bytes) -> bytes:
+    """
+    :param bytes header: encoded header
+    :return: the packed header of the block before it is sealed: no merkle root and no bloom filter yet
+    :rtype: bytes
+    """
+
+    fields = list(encoding.HEADER.unpack_from(header))
+    fields[5:8] = 0, 0, 0
+    fields[9] = NO_ROOT
+
+    return encoding.HEADER.pack(*fields)
+
+
+def header_might_concern(header: bytes, address: object) -> bool:
+    """
+    Test an address against the bloom filter of an encoded header, without the transactions of the block
+
+    :param bytes header: encoded header
+    :param address: address of a sender or a recipient
+    :return: False if no transaction of the block has this address, True if some may have it
+    :rtype: bool
+    """
+
+    size, _ = encoding.TRAILER.unpack_from(header, encoding.TRAILER_POSITION)
+    bloom_filter = header[encoding.HEADER.size:encoding.HEADER.size + size]
+
+    return bloom.might_contain(bloom_filter, header[HEADER_BLOOM], encoding.encode(address))
+
+
+def header_bytes(chain: object, height: int) -> bytes:
+    """
+    Encoded header of a block of a chain; a ChainStore or a SnapshotChain gives it without decoding the transactions
+
+    :param chain: list of the blocks, ChainStore or SnapshotChain
+    :param int height: height of the block
+    :return: the encoded header
+    :rtype: bytes
+    """
+
+    if hasattr(chain, 'header_bytes'):
+        return chain.header_bytes(height)
+
+    return chain[height].header_bytes()
+
+
+def _raw_hash(block_hash: object) -> bytes:
+    """
+    Raw 32 bytes of a block hash given in hex, left-padded with zeros (the genesis block has '0' as previous hash)
+
+    :param block_hash: hex string or raw bytes
+    :return: the raw hash
+    :rtype: bytes
+    """
+
+    if isinstance(block_hash, (bytes, bytearray)):
+        return bytes(block_hash)
+
+    return bytes.fromhex(block_hash.rjust(64, '0'))
+
+
+def hex_hash(raw_hash: bytes) -> str:
+    """
+    Hex of a raw block hash, the inverse of _raw_hash: the all-zero previous hash of the genesis block gives back '0'
+
+    :param bytes raw_hash: raw 32 bytes hash
+    :return: the hash in hex
+    :rtype: str
+    """
+
+    return raw_hash.hex() if any(raw_hash) else '0'
+
+
+
+class SealedData(list):
+    """
+    Read-only list holding the data of a sealed block, so its cached hash can't become wrong
+    """
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('the data of a sealed block cannot be modified')
+
+    append = extend = insert = pop = remove = clear = sort = reverse = _read_only
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+
+    def __reduce__(self) -> tuple:
+        return SealedData, (list(self),)
+
 
 
 class Block:
+    """
+    A block keeps its whole header packed in one bytes object, in its canonical encoding (followed by its hash once
+    sealed), and the transactions of a sealed block usually live in the TxArena of its chain.
+    Sealing also puts a bloom filter of the addresses of the transactions in the header, see Blockchain.scan.
+    """
+
+    __slots__ = ('_packed', '_data', '_slot')
 
-    def __init__(self, index: int, nonce: int, prev_hash: str, data: list, timestamp=None) -> None:
+    def __init__(self, index: int, nonce: int, prev_hash: str, data: list, timestamp=None, bits=0) -> None:
         """
         Initialisation of the Block class
 
         :param int index: index of the block
         :param int nonce: number of tries to find a hash that satisfies the difficulty
-        :param str prev_hash: previous block hash
+        :param str prev_hash: previous block hash, in hex or raw bytes
         :param list data: attached data to the block
         :param float timestamp: given timestamp or generated one with time module
+        :param int bits: difficulty of the block, number of zero bits required at the beginning of its proof hash
+        """
+
+        self._data = data
+        self._slot = None # slot of the transactions in the arena held by _data, None if _data is a list
+        self._packed = encoding.encode_header(index, nonce, timestamp or time(), bits, _raw_hash(prev_hash), NO_ROOT)
+
+
+    def _field(self, position: int) -> object:
+        """
+        Read a field of the packed header
+
+        :param int position: position of the field in encoding.HEADER
+        :return: the field
+        :rtype: object
+        """
+
+        return encoding.HEADER.unpack_from(self._packed)[position]
+
+
+    def _set_field(self, position: int, value: object) -> None:
+        """
+        Change a field of the packed header
+
+        :param int position: position of the field in encoding.HEADER
+        :param object value: new value
+        :raise: AttributeError if the block is sealed
+        """
+
+        if self.sealed:
+            raise AttributeError(f'block {self.index} is sealed, it cannot be modified')
+
+        fields = list(encoding.HEADER.unpack_from(self._packed))
+        fields[position] = value
+        self._packed = encoding.HEADER.pack(*fields)
+
+
+    index = property(lambda self: self._field(1), lambda self, value: self._set_field(1, value),
+                     doc='index of the block')
+    nonce = property(lambda self: self._field(2), lambda self, value: self._set_field(2, value),
+                     doc='number of tries to find a hash that satisfies the difficulty')
+    timestamp = property(lambda self: self._field(3), lambda self, value: self._set_field(3, value),
+                         doc='timestamp of the block')
+    bits = property(lambda self: self._field(4), lambda self, value: self._set_field(4, value),
+                    doc='difficulty of the block, number of zero bits required at the beginning of its proof hash')
+
+
+    @property
+    def prev_hash(self) -> str:
+        """
+        :return: previous block hash
+        :rtype: str
+        """
+
+        return hex_hash(self._packed[HEADER_PREV:HEADER_PREV + 32])
+
+
+    @prev_hash.setter
+    def prev_hash(self, value: str) -> None:
+        self._set_field(8, _raw_hash(value))
+
+
+    @property
+    def data(self) -> list:
+        """
+        Transactions of the block; those of a sealed block are a read-only copy, decoded from the arena if needed
+
+        :return: attached data to the block
+        :rtype: list
+        """
+
+        self._check_body()
+        if self._slot is not None:
+            return SealedData(self._data.transactions(self._slot))
+
+        return self._data
+
+
+    @data.setter
+    def data(self, value: list) -> None:
+        if self.sealed:
+            raise AttributeError(f'block {self.index} is sealed, it cannot be modified')
+
+        self._data = value
+
+
+    def transaction(self, position: int) -> dict:
+        """
+        One transaction of the block, without decoding the others
+
+        :param int position: position of the transaction in the block
+        :return: the transaction
+        :rtype: dict
+        """
+
+        self._check_body()
+        if self._slot is not None:
+            return self._data.transaction(self._slot, position)
+
+        return self._data[position]
+
+
+    def _addresses(self) -> set:
+        """
+        :return: encoded senders and recipients of the transactions, the items of the bloom filter
+        :rtype: set[bytes]
+        """
+
+        transactions = self._data.transactions(self._slot) if self._slot is not None else self._data
+        return {encoding.encode(tx[field]) for tx in transactions for field in ADDRESS_FIELDS}
+
+
+    def _encoded_transactions(self) -> list:
+        """
+        :return: binary encoding of each transaction
+        :rtype: list[bytes]
+        """
+
+        self._check_body()
+        if self._slot is not None:
+            return self._data.encoded(self._slot)
+
+        return [encoding.encode(tx) for tx in self._data]
+
+
+    @property
+    def pruned(self) -> bool:
+        """
+        :return: True if only the header of the block is kept, see snapshot.prune
+        :rtype: bool
+        """
+
+        return self._data is None
+
+
+    def _check_body(self) -> None:
+        """
+        :raise: LookupError if the transactions of the block were pruned
         """
 
-        self.index = index
-        self.nonce = nonce
-        self.prev_hash = prev_hash
-        self.data = data
-        self.timestamp = timestamp or time()
+        if self._data is None:
+            raise LookupError(f'the transactions of block {self.index} were pruned')
+
+
+    def move_to(self, arena: object) -> None:
+        """
+        Move the transactions of a sealed block to another arena, to let the blocks of the former one go
+
+        :param TxArena arena: new arena
+        """
+
+        if self._slot is not None:
+            self._slot = arena.add(self._data.encoded(self._slot))
+            self._data = arena
+
+
+    def seal(self, arena=None, bloom_rate=bloom.BLOOM_RATE, signer=None) -> str:
+        """
+        Freeze the block and compute its merkle root, bloom filter and hash once for all
+
+        :param TxArena arena: arena of the chain, where the transactions are moved; a new one for the block alone if
+            None
+        :param float bloom_rate: false positive rate of the bloom filter of the addresses
+        :param signer: function giving the signature of the encoded header, for a proof of authority chain
+        :return: hash of the block
+        :rtype: str
+        """
+
+        if not self.sealed:
+            encoded = self._encoded_transactions()
+            header = self._compute_header(encoded, bloom_rate)
+            if signer is not None:
+                header = encoding.add_signature(header, signer(header))
+
+            # the transactions are only kept encoded, each access decodes a copy: they can't be changed any more
+            arena = arena if arena is not None else TxArena()
+            self._slot = arena.add(encoded)
+            self._data = arena
+
+            self._packed = header + sha256(header).digest()
+
+        return self.hash_calculation
+
+
+    @property
+    def sealed(self) -> bool:
+        """
+        :return: True if the block is sealed
+        :rtype: bool
+        """
+
+        return len(self._packed) > encoding.HEADER.size
+
+
+    @property
+    def merkle_root(self) -> bytes:
+        """
+        Merkle root of the transactions, cached once the block is sealed
+
+        :return: merkle root
+        :rtype: bytes
+        """
+
+        if self.sealed:
+            return self._packed[HEADER_ROOT:HEADER_ROOT + 32]
+
+        return self._compute_merkle_root()
+
+
+    def _compute_merkle_root(self) -> bytes:
+        """
+        :return: merkle root of the transactions, computed from scratch; the one of the header if they were pruned
+        :rtype: bytes
+        """
+
+        if self.pruned:
+            return self._packed[HEADER_ROOT:HEADER_ROOT + 32]
+
+        leaves = [merkle.encoded_leaf_hash(raw) for raw in self._encoded_transactions()]
+        return merkle.build_levels_from_leaves(leaves)[-1][0]
+
+
+    def merkle_proof(self, position: int) -> list:
+        """
+        Inclusion proof of one transaction of the block, to be checked with Block.verify_transaction
+
+        :param int position: position of the transaction in the data of the block
+        :return: list of (True if the sibling is on the left, sibling hash)
+        :rtype: list[tuple[bool, bytes]]
+        :raise: IndexError if there is no transaction at this position
+        """
+
+        leaves = [merkle.encoded_leaf_hash(raw) for raw in self._encoded_transactions()]
+        return merkle.build_proof(merkle.build_levels_from_leaves(leaves), position)
+
+
+    @staticmethod
+    def verify_transaction(tx: dict, proof: list, merkle_root: bytes) -> bool:
+        """
+        Check that a transaction belongs to a block, knowing only the merkle root of its header
+
+        :param dict tx: transaction
+        :param list proof: inclusion proof given by Block.merkle_proof
+        :param bytes merkle_root: merkle root of the block
+        :return: True if the transaction is in the block, False otherwise
+        :rtype: bool
+        """
+
+        return merkle.verify_proof(tx, proof, merkle_root)
+
+
+    def header_bytes(self) -> bytes:
+        """
+        Binary encoding of the header of the block, which commits to the transactions through the merkle root
+
+        :return: the encoded header
+        :rtype: bytes
+        """
+
+        if self.sealed:
+            return self._packed[:-32]
+
+        return self._compute_header()
+
+
+    def _compute_header(self, encoded=None, bloom_rate=bloom.BLOOM_RATE) -> bytes:
+        """
+        Encoded header computed from scratch: merkle root and bloom filter of the transactions.
+        The filter of a sealed block is rebuilt with the size and number of hashes of its header, and its signature
+        is kept; a filter too small to hold any address is refused, see bloom.valid_parameters.
+
+        :param list encoded: binary encoding of each transaction, computed if None
+        :param float bloom_rate: false positive rate of the bloom filter of a block not sealed yet
+        :return: the encoded header, the one of the block if its transactions were pruned
+        :rtype: bytes
+        :raise: ValueError if the filter declared by a sealed block can't hold its addresses
+        """
+
+        if self.pruned:
+            return self._packed[:-32]
+
+        if encoded is None:
+            encoded = self._encoded_transactions()
+        root = merkle.build_levels_from_leaves([merkle.encoded_leaf_hash(raw) for raw in encoded])[-1][0]
+
+        fields = list(encoding.HEADER.unpack_from(self._packed))
+        addresses = self._addresses()
+        signature = b''
+        if self.sealed:
+            if not bloom.valid_parameters(len(addresses), fields[6], fields[5]):
+                raise ValueError(f'the bloom filter of block {self.index} can\'t hold its {len(addresses)} addresses')
+            fields[5], bloom_filter = bloom.build(addresses, hashes=fields[5], size=fields[6])
+            signature = encoding.split_signature(self._packed[:-32])[1]
+        else:
+            fields[5], bloom_filter = bloom.build(addresses, bloom_rate)
+        fields[6:8] = len(bloom_filter), len(signature)
+        fields[9] = root
+
+        return encoding.HEADER.pack(*fields) + bloom_filter + signature
+
+
+    def might_concern(self, address: object) -> bool:
+        """
+        Test an address against the bloom filter of the block, without reading its transactions
+
+        :param address: address of a sender or a recipient
+        :return: False if no transaction of the block has this address, True if some may have it
+        :rtype: bool
+        """
+
+        return header_might_concern(self.header_bytes(), address)
+
+
+    def byte_chunks(self) -> list:
+        """
+        Canonical binary encoding of the block, in chunks: a large payload is not copied
+
+        :return: the encoded chunks
+        :rtype: list
+        """
+
+        self._check_body()
+        if self._slot is not None:
+            # the transactions are already encoded back to back in the arena
+            count = self._data.count(self._slot)
+            return [self.header_bytes() + encoding.list_prefix(count), self._data.raw(self._slot)]
+
+        return encoding.encode_block_chunks(self.header_bytes(), self._data)
+
+
+    def to_bytes(self) -> bytes:
+        """
+        Canonical binary encoding of the block, used for storage
+
+        :return: the encoded block
+        :rtype: bytes
+        """
+
+        return b''.join(self.byte_chunks())
+
+
+    @classmethod
+    def from_bytes(cls, buffer: bytes, sealed=True) -> 'Block':
+        """
+        Rebuild a block from its binary encoding
+
+        :param bytes buffer: encoded block
+        :param bool sealed: if True, the block is sealed with the hash of its encoded header
+        :return: the decoded block
+        :rtype: Block
+        :raise: ValueError if the buffer is not a valid encoded block or if its transactions don't match its root or
+            its bloom filter
+        """
+
+        header, encoded = encoding.decode_block(buffer)
+        block = cls.__new__(cls)
+        block._data = TxArena() # an arena of its own, like a block sealed without the arena of a chain
+        block._slot = block._data.add(encoded)
+        block._packed = header + bytes(32) # sealed for a while, to rebuild the header with the same bloom filter size
+
+        if block._compute_header(encoded) != header:
+            raise ValueError(f'the transactions of block {block.index} do not match its header')
+
+        if sealed:
+            block._packed = header + sha256(header).digest()
+        else:
+            block._data = block._data.transactions(block._slot)
+            block._slot = None
+            block._packed = _unsealed_header(header)
+
+        return block
+
+
+    @classmethod
+    def from_header(cls, header: bytes) -> 'Block':
+        """
+        Rebuild a sealed block without its transactions, from its encoded header
+
+        :param bytes header: encoded header
+        :return: the pruned block
+        :rtype: Block
+        """
+
+        block = cls.__new__(cls)
+        block._data = None
+        block._slot = None
+        block._packed = bytes(header) + sha256(header).digest()
+
+        return block
+
+
+    def __reduce__(self) -> tuple:
+        # a block is pickled through its binary encoding
+        if self.pruned:
+            return Block.from_header, (self.header_bytes(),)
+
+        return Block.from_bytes, (self.to_bytes(), self.sealed)
 
 
     @property
     def hash_calculation(self) -> str:
         """
-        Calculation of a SHA256 hash
+        SHA256 hash of the block header, cached once the block is sealed
+
+        :return: hash of the block
+        :rtype: str
+        """
+
+        if self.sealed:
+            return self._packed[-32:].hex()
+
+        return self._compute_hash()
+
+
+    def _compute_hash(self) -> str:
+        """
+        Calculation of a SHA256 hash from scratch: merkle root and bloom filter of the transactions, then hash of the
+        header
 
         :return: hash of the block
         :rtype: str
         """
 
-        str_block = f'{self.index}{self.nonce}{self.prev_hash}{self.data}{self.timestamp}'
-        return sha256(str_block.encode()).hexdigest()
+        return sha256(self._compute_header()).hexdigest()
 
 
     def __repr__(self) -> str:
@@ -42,79 +564,435 @@ class Block:
         :return: presentation of a Block
         :rtype: str
         """
-        return f'\nIndex: {self.index} \nNonce: {self.nonce} \nPrevious hash: {self.prev_hash} \nData: {self.data}' \
+        data = '(pruned)' if self.pruned else self.data
+        return f'\nIndex: {self.index} \nNonce: {self.nonce} \nPrevious hash: {self.prev_hash} \nData: {data}' \
                f'\nTimestamp: {self.timestamp}\n'
 
 
 
 class Blockchain:
-    global difficulty
-    difficulty = 4
+    pow_engine = MidstateEngine() # kernel used by proof_of_work & verify_proof, any pow_engine.PowEngine
+    bloom_rate = bloom.BLOOM_RATE # false positive rate of the bloom filters of the blocks sealed by this chain
 
-    def __init__(self) -> None:
+    def __init__(self, chain=None, retarget=None, state=None, authority=None) -> None:
         """
         Initialization of the Blockchain class
+
+        :param chain: list of the blocks, or a chain_store.ChainStore to keep them on disk; a new list if None
+        :param Retarget retarget: difficulty rule of the chain, the one it was created with; Retarget() if None, or a
+            constant difficulty of 0 bits for a proof of authority chain
+        :param dict state: address indexes, latest minstd and verified height of the chain, saved by a snapshot; they
+            are rebuilt from the whole chain if None, the timestamps are read from the headers
+        :param ProofOfAuthority authority: authorities signing the blocks in turn, see authority.py; None for a proof
+            of work chain
         """
 
-        self.chain = []
+        self.chain = chain if chain is not None else []
+        self.authority = authority
+        self.retarget = retarget or (Retarget(0, 0) if authority is not None else Retarget())
         self.current_data = []
-        self.nodes = {}
-        self.genesis_block()
+        self.nodes = {} # address -> peer of the registered nodes, see new_node
+        self.mempool = Mempool() # transactions waiting to be gathered in a block
+        self.sealer = None       # thread sealing the mempool when a block is due, see start_sealer
+        self.arena = TxArena()   # transactions of the blocks sealed by this chain, unless a ChainStore keeps them
+        self.recipient_index = {} # address -> [(height, position)] of the transactions it received
+        self.sender_index = {}    # address -> [(height, position)] of the transactions it sent
+        self.latest_minstd = None # (height, position) of the last transaction carrying a minstd
+        self.timestamps = array('d') # timestamp of each block by height, increasing in a valid chain
+        self.verified_height = 0 # every block up to this index was checked by validate_chain
+        self.lock = threading.RLock() # held while the chain changes, for mining.BackgroundMiner
+
+        if not self.chain:
+            self.genesis_block()
+        elif state is not None:
+            self.recipient_index = state['recipient_index']
+            self.sender_index = state['sender_index']
+            self.latest_minstd = state['latest_minstd']
+            self.verified_height = state['verified_height']
+            self.timestamps = array('d', (encoding.HEADER.unpack_from(header_bytes(self.chain, height))[3]
+                                          for height in range(len(self.chain))))
+        else:
+            self.reindex()
+
+
+    def __getstate__(self) -> dict:
+        # the lock and the sealer thread stay in this process
+        state = self.__dict__.copy()
+        del state['lock']
+        state['sealer'] = None
+        return state
+
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
 
 
     def genesis_block(self) -> None:
         """
-        First block added to the blockchain, with arbitrary value of 0 for both nonce and previous hash
+        First block added to the blockchain, with arbitrary value of 0 for both nonce and previous hash.
+        It is not signed on a proof of authority chain: like its nonce, its signature is never checked.
         """
 
         self.add_block(nonce=0, prev_hash='0')
 
 
-    def add_block(self, nonce: int, prev_hash: str) -> Block:
+    def add_block(self, nonce: int, prev_hash: str, data=None) -> Block:
         """
         Addition of a block to the blockchain
 
         :param int nonce: number of tries to find a hash that satisfies the difficulty
-        :param str prev_hash: previous block hash
+        :param str prev_hash: previous block hash, the one of the last block of the chain
+        :param list data: transactions of the block, the current data if None
         :return: the block added
         :rtype: Block
+        :raise: ValueError if prev_hash is not the hash of the last block (another block was added since it was read),
+            or if it is not the turn of this node to sign the block of a proof of authority chain
         """
 
-        block = Block(
-            index=len(self.chain),
-            nonce=nonce,
-            prev_hash=prev_hash,
-            data=self.current_data)
-        self.current_data = []
+        with self.lock:
+            index = len(self.chain)
+            if index and _raw_hash(prev_hash) != _raw_hash(self.last_block.hash_calculation):
+                raise ValueError(f'block {index} must follow the last block of the chain, not block {prev_hash}')
+            signer = None
+            if self.authority is not None and index:
+                if not self.authority.can_sign(index):
+                    raise ValueError(f'block {index} must be signed by authority {self.authority.signer_at(index)}')
+                signer = lambda header: self.authority.sign(index, header)
+
+            # a block must be stamped after the last one, even if the clock of another node is ahead of this one
+            timestamp = max(time(), self.last_block.timestamp + TIMESTAMP_STEP) if index else None
+            block = Block(
+                index=index,
+                nonce=nonce,
+                prev_hash=prev_hash,
+                data=self.current_data if data is None else data,
+                timestamp=timestamp,
+                bits=self.bits_at(index))
+            if data is None:
+                self.current_data = []
+            # a ChainStore keeps the transactions on disk: the block is sealed in an arena of its own, released with it
+            block.seal(None if hasattr(self.chain, 'read_bytes') else self.arena, self.bloom_rate, signer)
+
+            self.chain.append(block)
+            self._index_block(block)
 
-        self.chain.append(block)
         return block
 
 
-    @staticmethod
-    def check_validity(prev_block: Block, block: Block) -> bool:
+    def _index_block(self, block: Block) -> None:
+        """
+        Add the transactions of a new block to the address indexes, move the latest minstd pointer and keep its
+        timestamp
+
+        :param Block block: block just added to the chain
+        """
+
+        self.timestamps.append(block.timestamp)
+        for position, tx in enumerate(block.data):
+            self.recipient_index.setdefault(tx['recipient'], []).append((block.index, position))
+            self.sender_index.setdefault(tx['sender'], []).append((block.index, position))
+            if type(tx['message']) == dict:
+                self.latest_minstd = (block.index, position)
+
+
+    def reindex(self) -> None:
+        """
+        Build the address indexes, the latest minstd pointer and the timestamps again from the whole chain
+        """
+
+        self.recipient_index = {}
+        self.sender_index = {}
+        self.latest_minstd = None
+        self.timestamps = array('d')
+
+        for block in self.chain:
+            self._index_block(block)
+
+
+    def replace_from(self, start: int, blocks: list) -> None:
+        """
+        Replace the blocks from a height by the ones of another chain, after checking them against the block before.
+        The transactions of the blocks dropped are not put back in the mempool.
+
+        :param int start: height of the first block replaced, the blocks are appended if it is the length of the chain
+        :param list blocks: sealed blocks, from height start
+        :raise: ValueError if a block is invalid
+        """
+
+        with self.lock:
+            if not 0 < start <= len(self.chain):
+                raise ValueError(f'no block before height {start} to link the blocks to')
+
+            first = context_start(start, self.retarget)
+            bad_index = check_blocks(self.chain[first:start] + list(blocks), self.retarget, Blockchain.pow_engine,
+                                     first=start - first, authority=self.authority)
+            if bad_index is not None:
+                raise ValueError(f'invalid block {bad_index}')
+
+            if start < len(self.chain):
+                self._rollback(start)
+
+            for block in blocks:
+                self.chain.append(block)
+                self._index_block(block)
+
+            if self.verified_height == start - 1:
+                self.verified_height = len(self.chain) - 1
+
+
+    def _rollback(self, height: int) -> None:
+        """
+        Drop the blocks from a height, and their transactions from the address indexes
+
+        :param int height: height of the first block dropped
+        """
+
+        if not hasattr(self.chain, 'read_bytes'):
+            # the blocks sealed by this chain were added to its arena in chain order: it is cut at the first one dropped
+            slots = [block._slot for block in self.chain[height:] if block._data is self.arena]
+            if slots:
+                self.arena.truncate(min(slots))
+
+        if hasattr(self.chain, 'truncate'):
+            self.chain.truncate(height)
+        else:
+            del self.chain[height:]
+
+        for index in (self.recipient_index, self.sender_index):
+            for positions in index.values():
+                del positions[bisect_left(positions, (height,)):]
+        del self.timestamps[height:]
+
+        if self.latest_minstd is not None and self.latest_minstd[0] >= height:
+            self.latest_minstd = self._latest_minstd_before(height)
+
+        self.verified_height = min(self.verified_height, height - 1)
+
+
+    def work_after(self, height: int) -> int:
+        """
+        Work of the blocks after a height, read from their headers: two chains sharing the blocks up to this height
+        are compared on it
+
+        :param int height: last height left out
+        :return: the sum of the work of each block, see retarget.work
+        :rtype: int
+        """
+
+        return sum(work(encoding.HEADER.unpack_from(header_bytes(self.chain, h))[4])
+                   for h in range(height + 1, len(self.chain)))
+
+
+    def _latest_minstd_before(self, height: int) -> tuple:
+        """
+        Find the last transaction carrying a minstd below a height, searching backwards as it is usually close
+
+        :param int height: height of the first block not searched
+        :return: (height, position) of the transaction, None if there is none or if it is in a pruned block
+        :rtype: tuple[int, int]
+        """
+
+        for block in (self.chain[h] for h in range(height - 1, -1, -1)):
+            if block.pruned:
+                return None
+            minstd = [position for position, tx in enumerate(block.data) if type(tx['message']) == dict]
+            if minstd:
+                return block.index, minstd[-1]
+
+        return None
+
+
+    def transactions_to(self, address: str, start_height=0, start_position=0) -> list:
+        """
+        Transactions received by an address, from a given height, in chain order
+
+        :param str address: wallet of the recipient
+        :param int start_height: first height to look at
+        :param int start_position: first position to look at in the block at start_height
+        :return: list of (height, position, transaction)
+        :rtype: list[tuple[int, int, dict]]
+        :raise: LookupError if a transaction is in a pruned block, see snapshot.prune
+        """
+
+        return self._transactions(self.recipient_index, address, start_height, start_position)
+
+
+    def transactions_from(self, address: str, start_height=0) -> list:
+        """
+        Transactions sent by an address, from a given height, in chain order
+
+        :param str address: wallet of the sender
+        :param int start_height: first height to look at
+        :return: list of (height, position, transaction)
+        :rtype: list[tuple[int, int, dict]]
+        :raise: LookupError if a transaction is in a pruned block, see snapshot.prune
+        """
+
+        return self._transactions(self.sender_index, address, start_height)
+
+
+    def _transactions(self, index: dict, address: str, start_height: int, start_position=0) -> list:
+        """
+        Read the transactions of an address index from a given height
+
+        :param dict index: recipient_index or sender_index
+        :param str address: wallet
+        :param int start_height: first height to look at
+        :param int start_position: first position to look at in the block at start_height
+        :return: list of (height, position, transaction)
+        :rtype: list[tuple[int, int, dict]]
+        """
+
+        positions = index.get(address, [])
+        found = []
+        block = None
+
+        for height, position in positions[bisect_left(positions, (start_height, start_position)):]:
+            if block is None or block.index != height:
+                block = self.chain[height]
+            found.append((height, position, block.transaction(position)))
+
+        return found
+
+
+    def scan(self, address: str, start_height=0, field=None):
+        """
+        Transactions of an address found through the bloom filters of the headers, without the address indexes:
+        the transactions of a block are only read if its filter matches, the other blocks are skipped on their header
+
+        :param str address: wallet
+        :param int start_height: first height to look at
+        :param str field: 'sender' or 'recipient' to keep the transactions where the address is in this field only,
+            both if None
+        :return: generator of (height, position, transaction), in chain order
+        :rtype: generator
+        :raise: LookupError if a block whose filter matches was pruned, see snapshot.prune
+        """
+
+        fields = ADDRESS_FIELDS if field is None else (field,)
+
+        for height in range(start_height, len(self.chain)):
+            if not header_might_concern(header_bytes(self.chain, height), address):
+                continue
+            for position, tx in enumerate(self.chain[height].data):
+                if any(tx[name] == address for name in fields):
+                    yield height, position, tx
+
+
+    def heights_between(self, start_time: float, end_time: float) -> range:
         """
-        Check the validity of 2 given blocks according to their hash, timestamp, proof and index
+        Heights of the blocks stamped in a period, found by bisection: the timestamps of a valid chain increase with
+        the height
 
-        :param Block prev_block: previous block
+        :param float start_time: beginning of the period, included
+        :param float end_time: end of the period, excluded
+        :return: the heights
+        :rtype: range
+        """
+
+        return range(bisect_left(self.timestamps, start_time), bisect_left(self.timestamps, end_time))
+
+
+    def blocks_between(self, start_time: float, end_time: float) -> list:
+        """
+        Blocks stamped in a period
+
+        :param float start_time: beginning of the period, included
+        :param float end_time: end of the period, excluded
+        :return: the blocks, in chain order
+        :rtype: list[Block]
+        """
+
+        heights = self.heights_between(start_time, end_time)
+        return self.chain[heights.start:heights.stop]
+
+
+    def transactions_in(self, heights: range):
+        """
+        Transactions of a range of heights
+
+        :param range heights: heights of the blocks, see heights_between
+        :return: generator of (height, position, transaction), in chain order
+        :rtype: generator
+        :raise: LookupError if a block of the range was pruned, see snapshot.prune
+        """
+
+        for height in heights:
+            for position, tx in enumerate(self.chain[height].data):
+                yield height, position, tx
+
+
+    def transactions_between(self, start_time: float, end_time=float('inf')):
+        """
+        Transactions of the blocks stamped in a period, e.g. the last hour with transactions_between(time() - 3600)
+
+        :param float start_time: beginning of the period, included
+        :param float end_time: end of the period, excluded, no end by default
+        :return: generator of (height, position, transaction), in chain order
+        :rtype: generator
+        :raise: LookupError if a block of the period was pruned, see snapshot.prune
+        """
+
+        return self.transactions_in(self.heights_between(start_time, end_time))
+
+
+    def bits_at(self, height: int) -> int:
+        """
+        Difficulty required for a block, from the blocks before it in the chain
+
+        :param int height: height of the block, at most the length of the chain
+        :return: number of zero bits required at the beginning of its proof hash
+        :rtype: int
+        """
+
+        prev_bits = self.chain[height - 1].bits if height else None
+        return self.retarget.expected(height, prev_bits, lambda h: self.chain[h].timestamp)
+
+
+    def check_validity(self, prev_block: Block, block: Block) -> bool:
+        """
+        Check the validity of 2 given blocks according to their hash, timestamp, difficulty, proof (or signature) and
+        index
+
+        :param Block prev_block: previous block, in the chain
         :param Block block: new block
         :return: True if blockchain is valid, False otherwise
         :rtype: bool
         """
 
-        if prev_block.hash_calculation != block.prev_hash:
-            return False
+        bits = self.bits_at(prev_block.index + 1)
+        return check_link(prev_block, prev_block.hash_calculation, block, bits, Blockchain.pow_engine, self.authority)
+
 
-        elif block.timestamp <= prev_block.timestamp:
-            return False
+    def validate_chain(self, workers=None) -> int:
+        """
+        Check the whole chain, starting after the last height already verified.
+        A cold start on a long chain is split between processes.
 
-        elif not Blockchain.verify_proof(prev_block.nonce, block.nonce):
-            return False
+        :param int workers: number of processes for a cold start, None to use every core, 1 to stay in this process
+        :return: index of the first invalid block, None if the chain is valid
+        :rtype: int
+        """
 
-        elif prev_block.index + 1 != block.index:
-            return False
+        if self.verified_height >= len(self.chain):
+            self.verified_height = 0 # the chain was replaced by a shorter one
 
-        return True
+        start = self.verified_height + 1
+        if len(self.chain) - start >= PARALLEL_MIN_BLOCKS and workers != 1:
+            bad_index = check_blocks_parallel(self.chain, start, self.retarget, Blockchain.pow_engine, workers,
+                                              self.authority)
+        else:
+            first = context_start(start, self.retarget)
+            bad_index = check_blocks(self.chain[first:], self.retarget, Blockchain.pow_engine, first=start - first,
+                                     authority=self.authority)
+
+        if bad_index is None:
+            self.verified_height = len(self.chain) - 1
+        else:
+            self.verified_height = max(bad_index - 1, 0)
+
+        return bad_index
 
 
     def new_data(self, sender: str, recipient: str, quantity: float, message: str) -> bool:
@@ -138,28 +1016,93 @@ class Blockchain:
         return True
 
 
-    @staticmethod
-    def proof_of_work(last_nonce: int) -> int:
+    def submit_data(self, sender: str, recipient: str, quantity: float, message: str, priority=0) -> TxHandle:
+        """
+        Put a new transaction in the mempool, to be mined with others by seal_pending
+
+        :param str sender: sender of the transaction
+        :param str recipient: receiver of the transaction
+        :param float quantity: quantity of tokens to send
+        :param str message: message attached to the transaction
+        :param int priority: the higher, the sooner the transaction is put in a block
+        :return: handle to wait until the transaction is in a block
+        :rtype: TxHandle
+        :raise: ValueError if the mempool is full
+        """
+
+        return self.mempool.add({
+            'sender': sender,
+            'recipient': recipient,
+            'quantity': quantity,
+            'message': message}, priority)
+
+
+    def seal_pending(self, miner_details: str, force=False, workers=1) -> Block:
+        """
+        Mine a block with the pending transactions of the mempool, if it is due (enough transactions or too old)
+
+        :param str miner_details: details of the miner
+        :param bool force: if True, seal whatever is pending even if the block is not due
+        :param int workers: number of processes sharing the proof of work
+        :return: the new block, None if no block was due
+        :rtype: Block
+        :raise: the error met if the block could not be made, the transactions being put back in the pool
+        """
+
+        with self.lock:
+            if not len(self.mempool) or not (force or self.mempool.due()):
+                return None
+            handles = self.mempool.take()
+
+        # the block holds the transactions of the pool only, at known positions, and the lock isn't held while mining
+        data = [handle.tx for handle in handles] + [self._reward(miner_details)]
+        try:
+            return self._mine(workers, data, handles)
+        except BaseException:
+            # no block: the transactions go back to the pool for the next one, their handles still waiting
+            self.mempool.put_back(handles)
+            raise
+
+
+    def start_sealer(self, miner_details: str, workers=1) -> Sealer:
+        """
+        Start a thread sealing the mempool as soon as a block is due, unless one is already running
+
+        :param str miner_details: details of the miner of the blocks
+        :param int workers: number of processes sharing the proof of work
+        :return: the sealer, sealer.close() stops it
+        :rtype: Sealer
+        """
+
+        with self.lock:
+            if self.sealer is None or not self.sealer.running:
+                self.sealer = Sealer(self, miner_details, workers)
+
+            return self.sealer
+
+
+    def proof_of_work(self, last_nonce: int, workers=1) -> int:
         """
-        Proof of work algorithm : count the attempts to verify the proof with the nonce variable
+        Proof of work algorithm : count the attempts to verify the proof with the nonce variable, at the difficulty of
+        the next block
 
         :param int last_nonce: previous number of tries required to find the hash
+        :param int workers: number of processes sharing the search, None to use every core
         :return: nonce
         :rtype: int
         """
 
-        nonce = 0
-
-        while not Blockchain.verify_proof(last_nonce, nonce):
-            nonce += 1
+        bits = self.bits_at(len(self.chain))
+        if workers != 1:
+            with ParallelMiner(workers, engine=Blockchain.pow_engine) as miner:
+                return miner.search(last_nonce, bits)
 
-        return nonce
+        return Blockchain.pow_engine.search(last_nonce, bits)
 
 
-    @staticmethod
-    def verify_proof(last_nonce: int, nonce: int) -> int:
+    def verify_proof(self, last_nonce: int, nonce: int) -> bool:
         """
-        Verify that the given hash match the desired one, with the difficulty required
+        Verify that the given hash match the desired one, with the difficulty required for the next block
 
         :param int last_nonce: previous nonce
         :param int nonce: current nonce
@@ -167,10 +1110,7 @@ class Blockchain:
         :rtype: bool
         """
 
-        to_find = f'{last_nonce}{nonce}'.encode()
-        hash_to_find = sha256(to_find).hexdigest()
-
-        return hash_to_find[:difficulty] == '0'*difficulty
+        return Blockchain.pow_engine.verify(last_nonce, nonce, self.bits_at(len(self.chain)))
 
 
     @property
@@ -185,44 +1125,95 @@ class Blockchain:
         return self.chain[-1]
 
 
-    def block_mining(self, miner_details: str) -> Block:
+    def block_mining(self, miner_details: str, workers=1) -> Block:
         """
-        Add a new block with the given miner details when validations are completed
+        Add a new block with the given miner details when validations are completed.
+        On a proof of authority chain the block is signed instead of mined, when it is the turn of this node.
 
         :param str miner_details: details of the miner
+        :param int workers: number of processes sharing the proof of work, None to use every core
         :return: the last block when validations are completed
         :rtype: Block
+        :raise: ValueError if it is not the turn of this node to sign the block of a proof of authority chain
         """
 
-        self.new_data(
-            sender='0', # chosen value 0 for a new block
-            recipient=miner_details,
-            quantity=1, # arbitrary value of 1
-            message='***Mining new block***')
+        if self.authority is not None and not self.authority.can_sign(len(self.chain)):
+            raise ValueError(f'block {len(self.chain)} must be signed by authority '
+                             f'{self.authority.signer_at(len(self.chain))}')
 
-        last_block = self.last_block
-        last_nonce = last_block.nonce
-        last_hash = last_block.hash_calculation
+        self.current_data.append(self._reward(miner_details))
+        return self._mine(workers)
 
-        nonce = self.proof_of_work(last_nonce)
-        block = self.add_block(nonce, last_hash)
 
-        return block
+    @staticmethod
+    def _reward(miner_details: str) -> dict:
+        """
+        :param str miner_details: details of the miner
+        :return: the transaction rewarding the miner of a block
+        :rtype: dict
+        """
+
+        return {
+            'sender': '0', # chosen value 0 for a new block
+            'recipient': miner_details,
+            'quantity': 1, # arbitrary value of 1
+            'message': '***Mining new block***'}
+
+
+    def _mine(self, workers: int, data=None, handles=()) -> Block:
+        """
+        Search the proof of the next block without holding the lock, then add the block if the last one is still the
+        same; otherwise the proof is searched again on the new last block
+
+        :param int workers: number of processes sharing the proof of work
+        :param list data: transactions of the block, the current data if None
+        :param list handles: handles of the first transactions of data, confirmed once the block is added
+        :return: the block added
+        :rtype: Block
+        """
 
+        while True:
+            with self.lock:
+                last_block = self.last_block
+                last_hash = last_block.hash_calculation
 
-    def new_node(self, address:  str) -> bool:
+            nonce = self.proof_of_work(last_block.nonce, workers) if self.authority is None else 0
+
+            with self.lock:
+                # another block was added meanwhile (a synchronisation or another miner): the proof is searched again
+                if self.last_block.hash_calculation == last_hash:
+                    block = self.add_block(nonce, last_hash, data)
+                    for position, handle in enumerate(handles):
+                        handle._confirm(block.index, position)
+                    return block
+
+
+    def new_node(self, address: str, peer=None) -> bool:
         """
-        Add a new node address
+        Add a new node address, asked for its chain by nodes.resolve_conflicts
 
-        :param str address: address of the new node
+        :param str address: address of the new node, 'host:port' if it is reached on a socket
+        :param peer: nodes.LocalPeer standing in for the node in this process, None to reach it at its address
         :return: True
         :rtype: bool
         """
 
-        self.nodes.add(address)
+        self.nodes[address] = peer
         return True
 
 
+    def remove_node(self, address: str) -> bool:
+        """
+        Remove a node address
+
+        :param str address: address of the node
+        :return: True if the node was registered, False otherwise
+        :rtype: bool
+        """
+
+        return self.nodes.pop(address, False) is not False
+
+
 
 if __name__ == '__main__':
 
@@ -230,15 +1221,12 @@ if __name__ == '__main__':
     -at first, we create a blockchain with 1 node, the genesis block and add 1 block
     -then, we mine another one'''
 
-    global difficulty
-    difficulty = 4  # number of 0 required at the beginning of the hash
-    print('Difficulty:', difficulty)
-
-
     # test 1
     blockchain = Blockchain()
-    blockchain.nodes = {'PC 1', 'PC 2', 'PC 3'}
-    print('Nodes:', blockchain.nodes, '\n')
+    print('Difficulty:', blockchain.bits_at(1), 'bits')
+    for node in ('PC 1', 'PC 2', 'PC 3'):
+        blockchain.new_node(node)
+    print('Nodes:', list(blockchain.nodes), '\n')
     print('Initial blockchain:\n', blockchain.chain)
 
     prev_block = blockchain.last_block
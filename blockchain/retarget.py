@@ -0,0 +1,94 @@
+"""
+Difficulty of the proof of work, in bits: the number of leading zero bits of the hash.
+Every `interval` blocks it is moved towards the target block time, from the time the last `interval` blocks took.
+"""
+
+
+from math import log2
+
+
+INITIAL_BITS = 16       # difficulty of the genesis block, the former 4 hex zeros
+RETARGET_INTERVAL = 20  # blocks between two changes of difficulty
+TARGET_BLOCK_TIME = 5.0 # seconds wanted between two blocks
+MAX_STEP = 2            # bits added or removed at most by one change, the work is multiplied by 4 at most
+MAX_BITS = 255
+
+
+def work(bits: int) -> int:
+    """
+    :param int bits: difficulty of a block
+    :return: number of hashes expected to find its proof; the chain with the most work is the one to follow
+    :rtype: int
+    """
+
+    return 1 << bits
+
+
+
+class Retarget:
+    """
+    Difficulty rule of a chain: every node of the chain must use the same one
+    """
+
+    def __init__(self, initial_bits=INITIAL_BITS, interval=RETARGET_INTERVAL, block_time=TARGET_BLOCK_TIME,
+                 max_step=MAX_STEP) -> None:
+        """
+        Initialization of the Retarget class
+
+        :param int initial_bits: difficulty of the genesis block, in bits
+        :param int interval: number of blocks between two changes, 0 to keep the initial difficulty for ever
+        :param float block_time: time wanted between two blocks in seconds
+        :param int max_step: maximum number of bits added or removed by one change
+        """
+
+        self.initial_bits = initial_bits
+        self.interval = interval
+        self.block_time = block_time
+        self.max_step = max_step
+
+
+    def is_retarget(self, height: int) -> bool:
+        """
+        :param int height: height of a block
+        :return: True if the difficulty may change at this height
+        :rtype: bool
+        """
+
+        return self.interval > 0 and height > self.interval and height % self.interval == 0
+
+
+    def adjust(self, bits: int, span: float) -> int:
+        """
+        New difficulty after `interval` blocks took `span` seconds: one bit more halves the chance of a hash
+
+        :param int bits: current difficulty
+        :param float span: time taken by the last interval blocks in seconds
+        :return: the new difficulty
+        :rtype: int
+        """
+
+        wanted = self.interval * self.block_time
+        step = round(log2(wanted / span)) if span > 0 else self.max_step
+        step = max(-self.max_step, min(self.max_step, step))
+
+        return max(0, min(MAX_BITS, bits + step))
+
+
+    def expected(self, height: int, prev_bits: int, timestamp_of) -> int:
+        """
+        Difficulty a block must have
+
+        :param int height: height of the block
+        :param int prev_bits: difficulty of the previous block
+        :param timestamp_of: function giving the timestamp of a lower height
+        :return: the difficulty in bits
+        :rtype: int
+        """
+
+        if height == 0:
+            return self.initial_bits
+
+        if not self.is_retarget(height):
+            return prev_bits
+
+        return self.adjust(prev_bits, timestamp_of(height - 1) - timestamp_of(height - 1 - self.interval))
@@ -0,0 +1,331 @@
+"""
+Snapshots of a chain: the state derived from the blocks (address indexes, latest minstd, key directory) and the
+headers, saved at a height. The bodies of the blocks below it can then be pruned, or moved to cold storage files,
+and a new node starts from a snapshot instead of replaying the whole chain.
+"""
+
+
+import os
+from array import array
+
+import encoding
+import sync
+from arena import TxArena
+from chain_store import ChainStore
+from python_blockchain import Block, Blockchain, header_bytes
+from retarget import Retarget
+
+
+SNAPSHOT_VERSION = 3
+
+
+def _header_offsets(headers: bytes) -> array:
+    """
+    :param bytes headers: encoded headers, one after the other
+    :return: position of each header, then the end of the last one
+    :rtype: array
+    :raise: ValueError if the last header is truncated
+    """
+
+    offsets = array('Q', [0])
+    while offsets[-1] < len(headers):
+        if len(headers) - offsets[-1] < encoding.HEADER.size:
+            raise ValueError('truncated header')
+        offsets.append(offsets[-1] + encoding.header_size(headers, offsets[-1]))
+
+    if offsets[-1] != len(headers):
+        raise ValueError('truncated header')
+
+    return offsets
+
+
+def _check_headers(chain: object, retarget: Retarget, authority=None) -> None:
+    """
+    Check the pruned headers of a snapshot like the ones received from a peer, see sync.check_headers: hash link,
+    index, timestamp, expected difficulty, and proof of work or signature of each one.
+    They are checked by batches, only the headers the difficulty of the next batch depends on being kept.
+
+    :param SnapshotChain chain: chain of the snapshot
+    :param Retarget retarget: difficulty rule of the chain
+    :param ProofOfAuthority authority: rule of a proof of authority chain, None for a proof of work chain
+    :raise: ValueError if a header is invalid
+    """
+
+    offsets = chain.offsets
+    headers = [sync.Header.from_bytes(chain.header_bytes(0))]
+    for start in range(1, chain.base, sync.HEADER_BATCH):
+        stop = min(start + sync.HEADER_BATCH, chain.base)
+        sync.check_headers(headers, chain.headers[offsets[start]:offsets[stop]], retarget, authority)
+        del headers[:-1 - retarget.interval]
+
+
+
+class SnapshotChain:
+    """
+    Chain whose blocks below a height are only kept as headers, usable in place of the Blockchain.chain list.
+    Their bodies are read from the cold storage if there is one; the block of the latest minstd is always kept.
+    """
+
+    def __init__(self, headers: bytes, cold=None, pinned=None, blocks=None) -> None:
+        """
+        Initialization of the SnapshotChain class
+
+        :param bytes headers: encoded headers of the pruned blocks, from height 0, one after the other
+        :param ChainStore cold: store holding the bodies of the pruned blocks, None if they were dropped
+        :param dict pinned: height -> block kept whole below the pruned height
+        :param list blocks: whole blocks after the pruned ones
+        """
+
+        self.headers = headers
+        self.offsets = _header_offsets(headers)
+        self.base = len(self.offsets) - 1 # number of pruned blocks
+        self.cold = cold
+        self.pinned = pinned or {}
+        self.blocks = blocks or []
+
+
+    def __len__(self) -> int:
+        return self.base + len(self.blocks)
+
+
+    def __getitem__(self, key: object) -> object:
+        """
+        Block at a height, or list of the blocks of a slice
+
+        :param key: height, negative heights count from the end, or slice
+        :return: block or list of blocks, a pruned block has no transactions
+        :rtype: Block or list[Block]
+        """
+
+        if isinstance(key, slice):
+            return [self[height] for height in range(*key.indices(len(self)))]
+
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError(f'no block at height {key}')
+
+        if key >= self.base:
+            return self.blocks[key - self.base]
+        if key in self.pinned:
+            return self.pinned[key]
+        if self.cold is not None and key < len(self.cold):
+            return self.cold[key]
+
+        return Block.from_header(self.header_bytes(key))
+
+
+    def header_bytes(self, height: int) -> bytes:
+        """
+        Encoded header of the block at a height, without reading its transactions
+
+        :param int height: height of the block
+        :return: the encoded header
+        :rtype: bytes
+        """
+
+        if height < 0:
+            height += len(self)
+        if height >= self.base:
+            return self[height].header_bytes()
+
+        return self.headers[self.offsets[height]:self.offsets[height + 1]]
+
+
+    def __iter__(self):
+        for height in range(len(self)):
+            yield self[height]
+
+
+    def append(self, block: Block) -> None:
+        self.blocks.append(block)
+
+
+    def truncate(self, height: int) -> None:
+        """
+        Drop the blocks from a height
+
+        :param int height: height of the first block dropped
+        :raise: ValueError if the height is below the pruned blocks
+        """
+
+        if height < self.base:
+            raise ValueError(f'the chain can not be rolled back below the snapshot height {self.base - 1}')
+
+        del self.blocks[height - self.base:]
+
+
+
+def _pack_index(index: dict, height: int) -> dict:
+    """
+    :param dict index: address -> [(height, position)]
+    :param int height: last height kept
+    :return: address -> positions up to the height, flattened in an array of unsigned 64 bits integers
+    :rtype: dict[str, bytes]
+    """
+
+    packed = {}
+    for address, positions in index.items():
+        flat = array('Q', [value for entry in positions if entry[0] <= height for value in entry])
+        if flat:
+            packed[address] = flat.tobytes()
+
+    return packed
+
+
+def _unpack_index(packed: dict) -> dict:
+    """
+    :param dict packed: index given by _pack_index
+    :return: address -> [(height, position)]
+    :rtype: dict
+    """
+
+    index = {}
+    for address, raw in packed.items():
+        flat = array('Q')
+        flat.frombytes(raw)
+        index[address] = list(zip(flat[::2], flat[1::2]))
+
+    return index
+
+
+def save_snapshot(blockchain: Blockchain, path: str, height=None, key_directory=None) -> int:
+    """
+    Save the derived state and the headers of a chain up to a height.
+    The file is written aside then renamed, so a snapshot is never left half written.
+
+    :param Blockchain blockchain: blockchain to save
+    :param str path: path of the snapshot file
+    :param int height: last height in the snapshot, the last block of the chain if None
+    :param dict key_directory: address -> public key of the participants known at this height, saved as it is
+    :return: the height of the snapshot
+    :rtype: int
+    """
+
+    chain = blockchain.chain
+    height = len(chain) - 1 if height is None else height
+    if not 0 <= height < len(chain):
+        raise ValueError(f'no block at height {height}')
+
+    latest_minstd = blockchain.latest_minstd
+    if latest_minstd is not None and latest_minstd[0] > height:
+        latest_minstd = blockchain._latest_minstd_before(height + 1)
+
+    retarget = blockchain.retarget
+    snapshot = {
+        'version': SNAPSHOT_VERSION,
+        'height': height,
+        'headers': b''.join(header_bytes(chain, h) for h in range(height + 1)),
+        'recipient_index': _pack_index(blockchain.recipient_index, height),
+        'sender_index': _pack_index(blockchain.sender_index, height),
+        'latest_minstd': list(latest_minstd) if latest_minstd is not None else None,
+        # the block of the latest minstd is kept whole, last_minstd reads its transaction
+        'minstd_block': chain[latest_minstd[0]].to_bytes() if latest_minstd is not None else None,
+        'key_directory': key_directory or {},
+        'retarget': [retarget.initial_bits, retarget.interval, retarget.block_time, retarget.max_step],
+        'authorities': blockchain.authority.export() if blockchain.authority is not None else None,
+    }
+
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as file:
+        for chunk in encoding.encode_chunks(snapshot):
+            file.write(chunk)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+    return height
+
+
+def load_snapshot(path: str, cold_directory=None, verify=True, key=None) -> tuple:
+    """
+    Start a blockchain from a snapshot, without replaying its blocks; the following ones come from a synchronisation
+
+    :param str path: path of the snapshot file
+    :param str cold_directory: directory of the ChainStore holding the pruned bodies, None if they are not needed
+    :param bool verify: if True, check each header against the previous ones like a header received from a peer: hash
+        link, index, timestamp, expected difficulty, and proof of work, or signature on a proof of authority chain
+    :param key: private key of this node if it is an authority of a proof of authority chain
+    :return: the blockchain and the key directory of the snapshot
+    :rtype: tuple[Blockchain, dict]
+    :raise: ValueError if the file is not a valid snapshot
+    """
+
+    with open(path, 'rb') as file:
+        snapshot, _ = encoding.decode(file.read())
+
+    if not isinstance(snapshot, dict) or snapshot.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f'{path} is not a snapshot of version {SNAPSHOT_VERSION}')
+
+    authority = None
+    if snapshot['authorities'] is not None:
+        from authority import ProofOfAuthority # the Crypto module is loaded only for a snapshot listing authorities
+        authority = ProofOfAuthority.from_export(snapshot['authorities'], key)
+
+    chain = SnapshotChain(snapshot['headers'])
+    retarget = Retarget(*snapshot['retarget'])
+    if verify:
+        _check_headers(chain, retarget, authority)
+
+    if snapshot['minstd_block'] is not None:
+        block = Block.from_bytes(snapshot['minstd_block'])
+        if block.index >= chain.base or block.header_bytes() != chain.header_bytes(block.index):
+            raise ValueError(f'block {block.index} of the snapshot does not match its header')
+        chain.pinned[block.index] = block
+
+    if cold_directory is not None:
+        chain.cold = ChainStore(cold_directory)
+
+    latest_minstd = snapshot['latest_minstd']
+    state = {
+        'recipient_index': _unpack_index(snapshot['recipient_index']),
+        'sender_index': _unpack_index(snapshot['sender_index']),
+        'latest_minstd': tuple(latest_minstd) if latest_minstd is not None else None,
+        'verified_height': snapshot['height'],
+    }
+    blockchain = Blockchain(chain, retarget, state, authority)
+
+    return blockchain, snapshot['key_directory']
+
+
+def prune(blockchain: Blockchain, height: int, cold_directory=None) -> None:
+    """
+    Drop the bodies of the blocks below a height, keeping their headers and the derived state.
+    The transactions of the blocks kept are moved to a new arena, so the memory of the pruned ones is released.
+
+    :param Blockchain blockchain: blockchain whose chain is a list or a SnapshotChain
+    :param int height: height of the first block kept whole
+    :param str cold_directory: directory of a ChainStore where the pruned bodies are moved, None to drop them
+    :raise: TypeError if the blocks of the chain are already kept on disk
+    """
+
+    chain = blockchain.chain
+    if isinstance(chain, ChainStore):
+        raise TypeError('a ChainStore already keeps the bodies of its blocks on disk')
+
+    with blockchain.lock:
+        height = min(height, len(chain) - 1) # the last block stays whole, the next one is linked to it
+        start = chain.base if isinstance(chain, SnapshotChain) else 0
+        if height <= start:
+            return
+
+        cold = chain.cold if isinstance(chain, SnapshotChain) else None
+        if cold_directory is not None:
+            cold = ChainStore(cold_directory)
+            for h in range(len(cold), height):
+                cold.append(chain[h])
+
+        headers = chain.headers if isinstance(chain, SnapshotChain) else b''
+        headers += b''.join(chain[h].header_bytes() for h in range(start, height))
+
+        pinned = {}
+        if blockchain.latest_minstd is not None and blockchain.latest_minstd[0] < height:
+            pinned[blockchain.latest_minstd[0]] = chain[blockchain.latest_minstd[0]]
+
+        blocks = list(chain[height:])
+        arena = TxArena()
+        for block in list(pinned.values()) + blocks:
+            block.move_to(arena)
+
+        blockchain.chain = SnapshotChain(headers, cold, pinned, blocks)
+        blockchain.arena = arena
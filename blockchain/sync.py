@@ -0,0 +1,471 @@
+"""
+Header-first synchronisation of a chain with another node.
+The last common height is found first, then the headers after it are fetched and checked, and only then the bodies of
+the missing blocks, in batches with several requests in flight: the work grows with the new blocks, not with the chain.
+"""
+
+
+import socket
+import socketserver
+import threading
+from collections import deque
+from hashlib import sha256
+from typing import NamedTuple
+
+import encoding
+from python_blockchain import Block, Blockchain, header_bytes, hex_hash
+from retarget import work
+from validation import check_link, context_start
+
+
+HEADER_BATCH = 2000 # headers per request
+BODY_BATCH = 200    # blocks per request
+WINDOW = 4          # requests sent before the first answer is read
+MAX_FETCH = 100000  # blocks fetched from a node at most in one synchronisation, the next ones in the following one
+
+
+class Header(NamedTuple):
+    """
+    Header of a block, enough to check its link with the previous one without its transactions
+    """
+
+    index: int
+    nonce: int
+    timestamp: float
+    bits: int
+    prev_hash: str
+    merkle_root: bytes
+    bloom_hashes: int
+    bloom: bytes
+    raw: bytes
+    hash: str
+
+    @classmethod
+    def from_bytes(cls, raw: bytes) -> 'Header':
+        """
+        :param bytes raw: encoded header
+        :return: the decoded header
+        :rtype: Header
+        :raise: ValueError if the version or the size of the header is wrong
+        """
+
+        if len(raw) < encoding.HEADER.size or len(raw) != encoding.header_size(raw):
+            raise ValueError('truncated header')
+
+        version, index, nonce, timestamp, bits, bloom_hashes, bloom_size, _, prev_hash, merkle_root = \
+            encoding.HEADER.unpack_from(raw)
+        if version != encoding.BLOCK_VERSION:
+            raise ValueError(f'unknown block version {version}')
+
+        bloom = bytes(raw[encoding.HEADER.size:encoding.HEADER.size + bloom_size])
+        return cls(index, nonce, timestamp, bits, hex_hash(prev_hash), merkle_root, bloom_hashes, bloom, bytes(raw),
+                   sha256(raw).hexdigest())
+
+
+    def header_bytes(self) -> bytes:
+        """
+        :return: the encoded header, like Block.header_bytes
+        :rtype: bytes
+        """
+
+        return self.raw
+
+
+
+class ChainServer:
+    """
+    Answers the requests of the nodes synchronising with a blockchain
+    """
+
+    def __init__(self, blockchain: Blockchain) -> None:
+        """
+        :param Blockchain blockchain: blockchain served
+        """
+
+        self.blockchain = blockchain
+
+
+    def handle(self, request: dict) -> object:
+        """
+        Answer one request
+
+        :param dict request: {'op': 'locate' | 'headers' | 'bodies', ...}
+        :return: the answer
+        :rtype: object
+        :raise: ValueError if the operation is unknown
+        """
+
+        chain = self.blockchain.chain
+        op = request['op']
+
+        if op == 'locate':
+            # the first height of the locator which holds the same block here is the last common height
+            for height, block_hash in zip(request['heights'], request['hashes']):
+                if height < len(chain) and sha256(header_bytes(chain, height)).digest() == block_hash:
+                    return {'common': height, 'length': len(chain), 'work': self.blockchain.work_after(height)}
+            return {'common': None, 'length': len(chain), 'work': None}
+
+        start, stop = request['start'], min(request['start'] + request['count'], len(chain))
+
+        if op == 'headers':
+            return b''.join(header_bytes(chain, height) for height in range(start, stop))
+
+        if op == 'bodies':
+            if hasattr(chain, 'read_bytes'):
+                return [bytes(chain.read_bytes(height)) for height in range(start, stop)]
+            return [chain[height].to_bytes() for height in range(start, stop)]
+
+        raise ValueError(f'unknown operation {op!r}')
+
+
+
+class LocalTransport:
+    """
+    Transport to a ChainServer of the same process: the answers are queued as the requests are sent
+    """
+
+    def __init__(self, server: ChainServer) -> None:
+        """
+        :param ChainServer server: server of the other node
+        """
+
+        self.server = server
+        self._answers = deque()
+
+
+    def send(self, request: dict) -> None:
+        self._answers.append(self.server.handle(request))
+
+
+    def receive(self) -> object:
+        return self._answers.popleft()
+
+
+    def close(self) -> None:
+        self._answers.clear()
+
+
+
+def _send_frame(sock: socket.socket, value: object) -> None:
+    """
+    Send a value in its binary encoding, after its length
+
+    :param socket.socket sock: connected socket
+    :param value: value to send
+    """
+
+    chunks = encoding.encode_chunks(value)
+    sock.sendall(encoding.LENGTH.pack(sum(len(chunk) for chunk in chunks)))
+    for chunk in chunks:
+        sock.sendall(chunk)
+
+
+def _receive_exactly(sock: socket.socket, size: int) -> bytearray:
+    """
+    :param socket.socket sock: connected socket
+    :param int size: number of bytes to read
+    :return: the bytes read
+    :rtype: bytearray
+    :raise: ConnectionError if the connection is closed before
+    """
+
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if not count:
+            raise ConnectionError('connection closed by the other node')
+        received += count
+
+    return buffer
+
+
+def _receive_frame(sock: socket.socket) -> object:
+    """
+    Receive a value sent by _send_frame
+
+    :param socket.socket sock: connected socket
+    :return: the value
+    :rtype: object
+    """
+
+    size, = encoding.LENGTH.unpack(_receive_exactly(sock, encoding.LENGTH.size))
+    return encoding.decode(_receive_exactly(sock, size))[0]
+
+
+
+class SocketTransport:
+    """
+    Transport to a ChainServer listening on a socket, see serve
+    """
+
+    def __init__(self, address: tuple, timeout=None) -> None:
+        """
+        :param tuple address: (host, port) of the server
+        :param float timeout: timeout of the socket operations in seconds, None to wait for ever
+        """
+
+        self.sock = socket.create_connection(address, timeout)
+
+
+    def send(self, request: dict) -> None:
+        _send_frame(self.sock, request)
+
+
+    def receive(self) -> object:
+        return _receive_frame(self.sock)
+
+
+    def close(self) -> None:
+        self.sock.close()
+
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    """
+    Connection of a node: its requests are answered in order until it closes the connection
+    """
+
+    def handle(self) -> None:
+        while True:
+            try:
+                request = _receive_frame(self.request)
+            except ConnectionError:
+                return
+            _send_frame(self.request, self.server.chain_server.handle(request))
+
+
+
+def serve(blockchain: Blockchain, address=('127.0.0.1', 0)) -> socketserver.ThreadingTCPServer:
+    """
+    Serve a blockchain on a socket, in a background thread
+
+    :param Blockchain blockchain: blockchain served
+    :param tuple address: (host, port) to listen on, a free port if the port is 0
+    :return: the server, server_address gives the address to connect to, shutdown() stops it
+    :rtype: socketserver.ThreadingTCPServer
+    """
+
+    server = socketserver.ThreadingTCPServer(address, _RequestHandler)
+    server.daemon_threads = True
+    server.chain_server = ChainServer(blockchain)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+
+def locator(chain: object) -> list:
+    """
+    Heights describing a chain to another node: the last ten, then further and further back, down to the genesis block
+
+    :param chain: list of the blocks or ChainStore
+    :return: heights from the highest to 0
+    :rtype: list[int]
+    """
+
+    heights = []
+    height, step = len(chain) - 1, 1
+    while height > 0:
+        heights.append(height)
+        if len(heights) >= 10:
+            step *= 2
+        height -= step
+    heights.append(0)
+
+    return heights
+
+
+def _pipelined(transport: object, requests: list, window: int):
+    """
+    Send the requests with up to window of them waiting for their answer
+
+    :param transport: LocalTransport or SocketTransport
+    :param requests: requests to send, iterated as they are sent
+    :param int window: maximum number of requests in flight
+    :return: generator of the answers, in the order of the requests
+    :rtype: generator
+    """
+
+    requests = iter(requests)
+    in_flight = 0
+    for request in requests:
+        transport.send(request)
+        in_flight += 1
+        if in_flight == window:
+            break
+
+    while in_flight:
+        answer = transport.receive()
+        in_flight -= 1
+        for request in requests:
+            transport.send(request)
+            in_flight += 1
+            break
+        yield answer
+
+
+def locate_request(chain: object) -> dict:
+    """
+    :param chain: list of the blocks or ChainStore
+    :return: request asking the other node for the last common height, the length of its chain and the work of its
+        blocks after the common height
+    :rtype: dict
+    """
+
+    heights = locator(chain)
+    return {'op': 'locate', 'heights': heights, 'hashes': [sha256(header_bytes(chain, h)).digest() for h in heights]}
+
+
+def batch_requests(op: str, start: int, stop: int, batch: int):
+    """
+    Requests covering a range of heights, made as they are sent: the range comes from the other node
+
+    :param str op: 'headers' or 'bodies'
+    :param int start: first height
+    :param int stop: end of the heights (excluded)
+    :param int batch: number of heights per request
+    :return: generator of the requests
+    :rtype: generator
+    """
+
+    for first in range(start, stop, batch):
+        yield {'op': op, 'start': first, 'count': min(batch, stop - first)}
+
+
+def context_headers(blockchain: Blockchain, common: int) -> list:
+    """
+    Local headers needed to check the headers after the common height: the common block, and the ones before it
+    which the difficulty of the next blocks depends on
+
+    :param Blockchain blockchain: local blockchain
+    :param int common: last common height
+    :return: the headers, up to the common height
+    :rtype: list[Header]
+    """
+
+    first = context_start(common + 1, blockchain.retarget)
+    return [Header.from_bytes(header_bytes(blockchain.chain, height)) for height in range(first, common + 1)]
+
+
+def check_headers(headers: list, raw: bytes, retarget: object, authority=None) -> None:
+    """
+    Check a batch of headers against the ones before them, and add them to the list of the checked ones
+
+    :param list headers: headers checked so far, after the context headers
+    :param bytes raw: encoded headers, one after the other
+    :param Retarget retarget: difficulty rule of the chain
+    :param ProofOfAuthority authority: rule of a proof of authority chain, None for a proof of work chain
+    :raise: ValueError if a header is invalid
+    """
+
+    base = headers[0].index
+    timestamp_of = lambda height: headers[height - base].timestamp
+    previous = headers[-1]
+
+    offset = 0
+    while offset < len(raw):
+        if len(raw) - offset < encoding.HEADER.size:
+            raise ValueError('truncated header')
+        size = encoding.header_size(raw, offset)
+        header = Header.from_bytes(raw[offset:offset + size])
+        offset += size
+        bits = retarget.expected(previous.index + 1, previous.bits, timestamp_of)
+        if not check_link(previous, previous.hash, header, bits, Blockchain.pow_engine, authority):
+            raise ValueError(f'invalid header at height {previous.index + 1}')
+        headers.append(header)
+        previous = header
+
+
+def headers_work(headers: list) -> int:
+    """
+    :param list headers: headers of consecutive blocks
+    :return: the sum of the work of each block, see retarget.work
+    :rtype: int
+    """
+
+    return sum(work(header.bits) for header in headers)
+
+
+def check_bodies(bodies: list, headers: list, blocks: list) -> None:
+    """
+    Decode a batch of blocks, each one matching the next header, and add them to the list of the received ones
+
+    :param list bodies: encoded blocks
+    :param list headers: checked headers of every block to receive
+    :param list blocks: blocks received so far
+    :raise: ValueError if a block is invalid or doesn't match its header
+    """
+
+    for raw in bodies:
+        block = Block.from_bytes(raw)
+        if len(blocks) >= len(headers) or block.header_bytes() != headers[len(blocks)].raw:
+            raise ValueError(f'block {block.index} does not match its header')
+        blocks.append(block)
+
+
+def fetch_headers(blockchain: Blockchain, transport: object, window=WINDOW) -> tuple:
+    """
+    Find the last common height with the other node, then fetch and check the headers of its blocks after it
+
+    :param Blockchain blockchain: local blockchain
+    :param transport: LocalTransport or SocketTransport
+    :param int window: maximum number of requests in flight
+    :return: the last common height and the headers after it, MAX_FETCH at most; no header if the other chain doesn't
+        have more work than the local one
+    :rtype: tuple[int, list[Header]]
+    :raise: ValueError if the chains have nothing in common or if a header is invalid
+    """
+
+    chain = blockchain.chain
+    transport.send(locate_request(chain))
+    answer = transport.receive()
+
+    common, length = answer['common'], answer['length']
+    if common is None:
+        raise ValueError('the other chain has a different genesis block')
+    local_work = blockchain.work_after(common)
+    if answer['work'] <= local_work:
+        return common, []
+
+    headers = context_headers(blockchain, common)
+    context = len(headers)
+    stop = min(length, common + 1 + MAX_FETCH)
+    for raw in _pipelined(transport, batch_requests('headers', common + 1, stop, HEADER_BATCH), window):
+        check_headers(headers, raw, blockchain.retarget, blockchain.authority)
+
+    if headers_work(headers[context:]) <= local_work:
+        return common, [] # the other chain lost blocks meanwhile
+
+    return common, headers[context:]
+
+
+def sync(blockchain: Blockchain, transport: object, window=WINDOW) -> int:
+    """
+    Bring a blockchain up to date with the chain of another node, if it has more work: the sum of the work of its
+    blocks after the last common height, see retarget.work, is compared with the one of the local blocks.
+    The bodies are fetched once all the headers are checked, and each one must match its header.
+
+    :param Blockchain blockchain: local blockchain
+    :param transport: LocalTransport or SocketTransport
+    :param int window: maximum number of requests in flight
+    :return: height of the first block added, None if the chain was already up to date
+    :rtype: int
+    :raise: ValueError if the other node sends an invalid header or block
+    """
+
+    common, headers = fetch_headers(blockchain, transport, window)
+    if not headers:
+        return None
+
+    blocks = []
+    for bodies in _pipelined(transport, batch_requests('bodies', common + 1, common + 1 + len(headers), BODY_BATCH),
+                             window):
+        check_bodies(bodies, headers, blocks)
+
+    if len(blocks) != len(headers):
+        raise ValueError('the other node did not send every block')
+
+    blockchain.replace_from(common + 1, blocks)
+    return common + 1
@@ -0,0 +1,41 @@
+"""
+Bloom filters of the blocks: a block can't declare a filter which hides the addresses of its transactions
+"""
+
+
+import pytest
+
+import bloom
+import encoding
+from python_blockchain import Block, Blockchain
+
+
+def test_block_filter_holds_addresses():
+    blockchain = Blockchain()
+    blockchain.bloom_rate = 1.0
+    blockchain.new_data('alice', 'bob', 1, 'message')
+    blockchain.block_mining('miner')
+
+    assert [tx['recipient'] for _, _, tx in blockchain.scan('bob')] == ['bob']
+
+
+@pytest.mark.parametrize('size, hashes', [(0, 0), (0, 3), (8, 0)])
+def test_empty_filter_rejected(size, hashes):
+    blockchain = Blockchain()
+    blockchain.new_data('alice', 'bob', 1, 'message')
+    raw = blockchain.block_mining('miner').to_bytes()
+
+    fields = list(encoding.HEADER.unpack_from(raw))
+    fields[5:7] = hashes, size
+    bloom_filter = bytes(size)
+    body = raw[encoding.header_size(raw):]
+    forged = encoding.HEADER.pack(*fields) + bloom_filter + body
+
+    with pytest.raises(ValueError):
+        Block.from_bytes(forged)
+
+
+def test_parameters():
+    assert bloom.parameters(0, bloom.BLOOM_RATE) == (0, 0)
+    assert all(bloom.valid_parameters(count, *bloom.parameters(count, rate))
+               for count in (1, 10, 1000) for rate in (0.5, 0.01, 1.0))
@@ -0,0 +1,50 @@
+"""
+Decoding of truncated or corrupted data: it must be rejected with a ValueError, never read past the end of the data
+"""
+
+
+import pytest
+
+import encoding
+from python_blockchain import Block, Blockchain
+
+
+VALUE = {'sender': 'a', 'recipient': 'b', 'quantity': 1.5, 'message': {'minstd': -7, 'data': b'\x00' * 40},
+         'list': [None, True, False, 2**70, 'texte']}
+
+
+def test_round_trip():
+    assert encoding.decode(encoding.encode(VALUE)) == (VALUE, len(encoding.encode(VALUE)))
+
+
+def test_bytes_views():
+    raw = encoding.encode(['a', b'payload'])
+    (text, payload), _ = encoding.decode(raw, views=True)
+    assert isinstance(payload, memoryview) and payload.obj is raw and payload == b'payload'
+
+
+def test_genesis_round_trip():
+    genesis = Blockchain().chain[0]
+    assert genesis.prev_hash == Block.from_bytes(genesis.to_bytes()).prev_hash == '0'
+
+
+@pytest.mark.parametrize('size', range(len(encoding.encode(VALUE))))
+def test_truncated_value(size):
+    with pytest.raises(ValueError):
+        encoding.decode(encoding.encode(VALUE)[:size])
+
+
+def test_truncated_block():
+    blockchain = Blockchain()
+    blockchain.new_data('a', 'b', 1, VALUE)
+    raw = blockchain.block_mining('miner').to_bytes()
+
+    for size in range(len(raw)):
+        with pytest.raises(ValueError):
+            encoding.decode_block(raw[:size])
+
+
+@pytest.mark.parametrize('raw', [b'l\xff\xff\xff\xff', b'd\x00\x00\x00\x01l\x00\x00\x00\x00N', b'?'])
+def test_invalid_value(raw):
+    with pytest.raises(ValueError):
+        encoding.decode(raw)
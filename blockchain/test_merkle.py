@@ -0,0 +1,28 @@
+"""
+Inclusion proofs of the transactions of a block
+"""
+
+
+import pytest
+
+from python_blockchain import Block, Blockchain
+
+
+def test_proof_of_each_transaction():
+    blockchain = Blockchain()
+    for i in range(4):
+        blockchain.new_data('alice', 'bob', i, 'message')
+    block = blockchain.block_mining('miner')
+
+    assert all(Block.verify_transaction(tx, block.merkle_proof(position), block.merkle_root)
+               for position, tx in enumerate(block.data))
+
+
+@pytest.mark.parametrize('height, position', [(0, 0), (1, 2), (1, -1)])
+def test_no_transaction_at_position(height, position):
+    blockchain = Blockchain()
+    blockchain.new_data('alice', 'bob', 1, 'message')
+    blockchain.block_mining('miner')
+
+    with pytest.raises(IndexError):
+        blockchain.chain[height].merkle_proof(position)
@@ -0,0 +1,119 @@
+"""
+Resolution of conflicts against several in-process stand-in nodes, see nodes.LocalPeer
+"""
+
+
+import time
+
+import nodes
+from python_blockchain import Blockchain
+from retarget import Retarget
+
+
+RETARGET = Retarget(8, 0) # an easy constant difficulty: the blocks are mined at once
+
+
+def mined(base: Blockchain, count: int, miner: str) -> Blockchain:
+    """
+    :param Blockchain base: chain whose blocks are shared
+    :param int count: number of blocks mined after them
+    :param str miner: details of the miner, to tell the chains apart
+    :return: a new chain
+    :rtype: Blockchain
+    """
+
+    blockchain = Blockchain(list(base.chain), RETARGET)
+    for _ in range(count):
+        blockchain.new_data('alice', miner, 1, f'message of {miner}')
+        blockchain.block_mining(miner)
+
+    return blockchain
+
+
+def invalid(base: Blockchain, count: int) -> Blockchain:
+    """
+    :param Blockchain base: chain whose blocks are shared
+    :param int count: number of blocks added after them without a valid proof of work
+    :return: a new chain
+    :rtype: Blockchain
+    """
+
+    blockchain = Blockchain(list(base.chain), RETARGET)
+    for _ in range(count):
+        last_block = blockchain.last_block
+        nonce = next(nonce for nonce in range(1000) if not blockchain.verify_proof(last_block.nonce, nonce))
+        blockchain.add_block(nonce, last_block.hash_calculation)
+
+    return blockchain
+
+
+class LyingServer:
+    """
+    Server claiming a chain far longer than the one it serves
+    """
+
+    def __init__(self, server: object) -> None:
+        self.server = server
+
+
+    def handle(self, request: dict) -> object:
+        answer = self.server.handle(request)
+        if request['op'] == 'locate':
+            answer = dict(answer, length=2**62, work=2**62)
+        return answer
+
+
+
+def test_adopt_longer_chain():
+    genesis = Blockchain(retarget=RETARGET)
+    local, short, long = mined(genesis, 1, 'local'), mined(genesis, 2, 'short'), mined(genesis, 4, 'long')
+    local.new_node('short', nodes.LocalPeer(short))
+    local.new_node('long', nodes.LocalPeer(long))
+
+    assert nodes.resolve_conflicts(local)
+    assert [block.hash_calculation for block in local.chain] == [block.hash_calculation for block in long.chain]
+    assert not nodes.resolve_conflicts(local)
+
+
+def test_slow_peer_left_out():
+    genesis = Blockchain(retarget=RETARGET)
+    local = Blockchain(list(genesis.chain), RETARGET)
+    local.new_node('slow', nodes.LocalPeer(mined(genesis, 4, 'slow'), delay=1.0))
+    local.new_node('fast', nodes.LocalPeer(mined(genesis, 2, 'fast')))
+
+    start = time.perf_counter()
+    assert nodes.resolve_conflicts(local, timeout=0.1)
+    assert time.perf_counter() - start < 1.0
+    assert local.last_block.data[0]['recipient'] == 'fast'
+
+
+def test_invalid_peer_skipped():
+    genesis = Blockchain(retarget=RETARGET)
+    local = Blockchain(list(genesis.chain), RETARGET)
+    local.new_node('invalid', nodes.LocalPeer(invalid(genesis, 6)))
+    local.new_node('valid', nodes.LocalPeer(mined(genesis, 2, 'valid')))
+
+    assert nodes.resolve_conflicts(local)
+    assert len(local.chain) == 3 and local.validate_chain() is None
+
+
+def test_forked_suffix_rolled_back():
+    common = mined(Blockchain(retarget=RETARGET), 2, 'common')
+    local, fork = mined(common, 2, 'local'), mined(common, 3, 'fork')
+    local.new_node('fork', nodes.LocalPeer(fork))
+
+    assert nodes.resolve_conflicts(local)
+    assert [block.hash_calculation for block in local.chain] == [block.hash_calculation for block in fork.chain]
+    assert not local.recipient_index['local'] and len(local.recipient_index['fork']) == 6
+
+
+def test_lying_length_bounded():
+    genesis = Blockchain(retarget=RETARGET)
+    local = Blockchain(list(genesis.chain), RETARGET)
+    peer = nodes.LocalPeer(mined(genesis, 2, 'liar'))
+    peer.server = LyingServer(peer.server)
+    local.new_node('liar', peer)
+
+    start = time.perf_counter()
+    nodes.resolve_conflicts(local)
+    assert time.perf_counter() - start < 5.0
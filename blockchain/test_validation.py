@@ -0,0 +1,71 @@
+"""
+Timestamps of the blocks, which the difficulty follows, and comparison of chains on their work
+"""
+
+
+from time import time
+
+import pytest
+
+import sync
+from python_blockchain import Block, Blockchain
+from retarget import Retarget
+
+
+def forged_block(blockchain: Blockchain, timestamp: float) -> Block:
+    """
+    :param Blockchain blockchain: chain the block follows
+    :param float timestamp: timestamp of the block
+    :return: a block with a valid proof on the last block of the chain, stamped at timestamp
+    :rtype: Block
+    """
+
+    last_block, bits = blockchain.last_block, blockchain.bits_at(len(blockchain.chain))
+    block = Block(len(blockchain.chain), Blockchain.pow_engine.search(last_block.nonce, bits),
+                  last_block.hash_calculation, [{'sender': '0', 'recipient': 'miner', 'quantity': 1, 'message': ''}],
+                  timestamp, bits)
+    block.seal()
+    return block
+
+
+def chain_of(genesis: Blockchain, count: int, gap: float) -> Blockchain:
+    """
+    :param Blockchain genesis: chain whose genesis block is shared
+    :param int count: number of blocks after it
+    :param float gap: time between two blocks in seconds
+    :return: a new chain of blocks stamped gap seconds apart
+    :rtype: Blockchain
+    """
+
+    blockchain = Blockchain(genesis.chain[:1], genesis.retarget)
+    for i in range(count):
+        block = forged_block(blockchain, genesis.chain[0].timestamp + gap * (i + 1))
+        blockchain.replace_from(len(blockchain.chain), [block])
+
+    return blockchain
+
+
+def test_future_block_rejected():
+    blockchain = Blockchain(retarget=Retarget(4, 4))
+    with pytest.raises(ValueError):
+        blockchain.replace_from(1, [forged_block(blockchain, time() + 30 * 365 * 86400)])
+
+
+def test_block_stamped_after_last_one():
+    blockchain = Blockchain(retarget=Retarget(4, 4))
+    blockchain.replace_from(1, [forged_block(blockchain, time() + 600)])
+    blockchain.block_mining('miner')
+
+    assert blockchain.chain[2].timestamp > blockchain.chain[1].timestamp
+    assert blockchain.validate_chain() is None
+
+
+def test_most_work_wins():
+    genesis = Blockchain(retarget=Retarget(10, 4, 0.01))
+    # blocks spaced out lower the difficulty: the longer chain has less work
+    cheap, honest = chain_of(genesis, 16, 1.0), chain_of(genesis, 10, 0.01)
+    assert cheap.work_after(0) < honest.work_after(0)
+
+    assert sync.sync(cheap, sync.LocalTransport(sync.ChainServer(honest))) == 1
+    assert len(cheap.chain) == 11
+    assert sync.sync(honest, sync.LocalTransport(sync.ChainServer(chain_of(genesis, 16, 1.0)))) is None
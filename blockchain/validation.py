@@ -0,0 +1,203 @@
+"""
+Validation of a whole chain: the blocks are checked link by link, either in this process or split between a pool of
+processes for a cold start
+"""
+
+
+import multiprocessing as mp
+from time import time
+
+
+PARALLEL_MIN_BLOCKS = 5000 # below this number of blocks to check, starting processes costs more than it saves
+MAX_FUTURE_TIME = 2 * 60 * 60 # seconds a block may be stamped ahead of the clock of this node
+
+
+def check_link(prev_block: object, prev_hash: str, block: object, bits: int, engine: object, authority=None) -> bool:
+    """
+    Check that a block follows the previous one, according to hash, timestamp, difficulty, proof and index.
+    The timestamp must be after the previous one, and at most MAX_FUTURE_TIME ahead of now: the difficulty follows the
+    timestamps, a chain stamped in the future would lower it.
+
+    :param Block prev_block: previous block
+    :param str prev_hash: hash of the previous block
+    :param Block block: new block
+    :param int bits: difficulty the block must have, number of zero bits required at the beginning of the proof hash
+    :param PowEngine engine: proof of work engine verifying the nonce
+    :param ProofOfAuthority authority: rule of a proof of authority chain, its signature is checked instead of the
+        nonce; None for a proof of work chain
+    :return: True if the link is valid, False otherwise
+    :rtype: bool
+    """
+
+    if prev_hash != block.prev_hash:
+        return False
+
+    elif prev_block.index + 1 != block.index:
+        return False
+
+    elif not prev_block.timestamp < block.timestamp <= time() + MAX_FUTURE_TIME:
+        return False
+
+    elif block.bits != bits:
+        return False
+
+    # the signature is checked for the height the block really has in the chain, not the index it declares
+    if authority is not None:
+        return authority.verify(prev_block.index + 1, block.header_bytes())
+
+    return engine.verify(prev_block.nonce, block.nonce, bits)
+
+
+def context_start(start: int, retarget: object) -> int:
+    """
+    :param int start: index of the first block to check
+    :param Retarget retarget: difficulty rule of the chain
+    :return: index of the first block needed to check it: its previous block, and the ones before for the difficulty
+    :rtype: int
+    """
+
+    return max(start - 1 - retarget.interval, 0)
+
+
+def check_blocks(blocks: list, retarget: object, engine: object, stop_event=None, first=1, authority=None) -> int:
+    """
+    Check a run of consecutive blocks, the ones before blocks[first] being already trusted.
+    No block is hashed again: the hash of a sealed block is cached when it is sealed, or when it is decoded by
+    Block.from_bytes, which checks its transactions against its header.
+
+    :param list blocks: consecutive blocks, from context_start of the first one to check
+    :param Retarget retarget: difficulty rule of the chain
+    :param PowEngine engine: proof of work engine verifying the nonces
+    :param stop_event: event checked regularly, the check is abandoned when it is set
+    :param int first: position in blocks of the first block to check
+    :param ProofOfAuthority authority: rule of a proof of authority chain, None for a proof of work chain
+    :return: index of the first invalid block, None if all are valid or if the check was stopped
+    :rtype: int
+    """
+
+    base = blocks[0].index if blocks else 0
+    timestamp_of = lambda height: blocks[height - base].timestamp
+
+    for i in range(first, len(blocks)):
+        if stop_event is not None and i % 256 == 0 and stop_event.is_set():
+            return None
+
+        prev_block, block = blocks[i - 1], blocks[i]
+        prev_hash = prev_block.hash_calculation
+        bits = retarget.expected(prev_block.index + 1, prev_block.bits, timestamp_of)
+        if not check_link(prev_block, prev_hash, block, bits, engine, authority):
+            return prev_block.index + 1
+
+    return None
+
+
+_stop_event = None
+
+
+def _init_worker(stop_event: object) -> None:
+    """
+    Initialization of a worker process, keeping the shared stop event
+
+    :param multiprocessing.Event stop_event: event set by the parent process when the result is known
+    """
+
+    global _stop_event
+    _stop_event = stop_event
+
+
+def _encoded_chunk(chain: object, start: int, stop: int) -> tuple:
+    """
+    Blocks of a chunk as they are sent to a worker, without decoding them in this process: the encoded blocks of a
+    ChainStore, checked against their header when the worker decodes them, or the headers of blocks in memory, whose
+    transactions were checked when they were sealed or decoded
+
+    :param chain: the whole chain
+    :param int start: height of the first block of the chunk
+    :param int stop: height after the last block of the chunk
+    :return: True if the chunk holds whole encoded blocks, False if it holds headers, and the encoded blocks or headers
+    :rtype: tuple[bool, list[bytes]]
+    """
+
+    if hasattr(chain, 'read_bytes'):
+        return True, [bytes(chain.read_bytes(height)) for height in range(start, stop)]
+
+    return False, [chain[height].header_bytes() for height in range(start, stop)]
+
+
+def _check_chunk(whole: bool, encoded: list, height: int, retarget: object, engine: object, first: int,
+                 authority: object) -> int:
+    """
+    Worker side of check_blocks
+
+    :param bool whole: True if encoded holds whole encoded blocks, False if it holds headers
+    :param list encoded: consecutive blocks, see _encoded_chunk
+    :param int height: height of the first of them
+    :param Retarget retarget: difficulty rule of the chain
+    :param PowEngine engine: proof of work engine verifying the nonces
+    :param int first: position in encoded of the first block to check
+    :param ProofOfAuthority authority: rule of a proof of authority chain, None for a proof of work chain
+    :return: index of the first invalid block, None if all are valid
+    :rtype: int
+    """
+
+    from python_blockchain import Block # python_blockchain imports this module
+
+    blocks = []
+    for raw in encoded:
+        try:
+            blocks.append(Block.from_bytes(raw) if whole else Block.from_header(raw))
+        except ValueError:
+            # a block before it, already decoded, may be the first invalid one
+            bad_index = check_blocks(blocks, retarget, engine, _stop_event, first, authority)
+            return bad_index if bad_index is not None else height + len(blocks)
+
+    return check_blocks(blocks, retarget, engine, _stop_event, first, authority)
+
+
+def check_blocks_parallel(chain: list, start: int, retarget: object, engine: object, workers=None,
+                          authority=None) -> int:
+    """
+    Check the blocks chain[start:] against their previous one, split in contiguous chunks between processes.
+    Neighbour chunks overlap: a chunk also holds the blocks before its first one needed for the link and the difficulty.
+
+    :param list chain: the whole chain
+    :param int start: index of the first block to check, at least 1
+    :param Retarget retarget: difficulty rule of the chain
+    :param PowEngine engine: proof of work engine verifying the nonces
+    :param int workers: number of processes, os.cpu_count() if None
+    :param ProofOfAuthority authority: rule of a proof of authority chain, None for a proof of work chain
+    :return: index of the first invalid block, None if all are valid
+    :rtype: int
+    """
+
+    workers = workers or mp.cpu_count()
+    chunk_size = max(PARALLEL_MIN_BLOCKS // 4, -(-(len(chain) - start) // (4 * workers)))
+    starts = iter(range(start, len(chain), chunk_size))
+    pending = []
+    stop_event = mp.Event()
+
+    with mp.Pool(workers, initializer=_init_worker, initargs=(stop_event,)) as pool:
+        try:
+            # a few chunks are queued at a time and come back in order: the first invalid index found is the first
+            # one of the chain, and the chunks after it are never sent
+            while True:
+                for i in starts:
+                    first = context_start(i, retarget)
+                    whole, encoded = _encoded_chunk(chain, first, min(i + chunk_size, len(chain)))
+                    pending.append(pool.apply_async(
+                        _check_chunk, (whole, encoded, first, retarget, engine, i - first, authority)))
+                    if len(pending) >= 2 * workers:
+                        break
+
+                if not pending:
+                    return None
+
+                bad_index = pending.pop(0).get()
+                if bad_index is not None:
+                    return bad_index
+
+        finally:
+            # the pool can't be terminated while a chunk is still being sent to a worker
+            stop_event.set()
+            for result in pending:
+                result.wait()
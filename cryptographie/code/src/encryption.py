@@ -12,6 +12,7 @@ from Crypto.Cipher import AES, PKCS1_OAEP
 from Crypto.Signature import pss as PKCS1_PSS
 from Crypto.Hash import SHA256
 from Crypto.PublicKey import RSA
+from Crypto.Random import get_random_bytes
 
 import pickle, logging, os
 
@@ -215,6 +216,57 @@ def asymmetricRSADecryption(encryptedData: bytes, privateKey: RSA.RsaKey) -> obj
 
 
 
+def hybridEncryption(data: bytes, publicKey: RSA.RsaKey) -> bytes:
+    """
+    Encryptes some data of any size with an envelope: a new AES-256 key is drawn for each message and encrypted with
+    PKCS#1 OAEP, while the data itself is encrypted with this key in GCM mode. Only one RSA operation is made whatever
+    the size of the data.
+    The envelope is: encrypted AES key (as long as the RSA key), nonce (12 bytes), tag (16 bytes), encrypted data.
+
+    :param bytes data: the data to encrypt, it is not pickled
+    :param RSA.RsaKey publicKey: the key of the recipient, can be public or private
+    :return: the envelope
+    :rtype: bytes
+    """
+    symmetricKey = get_random_bytes(32)
+    wrappedKey = PKCS1_OAEP.new(publicKey).encrypt(symmetricKey)
+
+    cipherObject = AES.new(symmetricKey, AES.MODE_GCM, nonce=get_random_bytes(12))
+    cipherObject.update(wrappedKey) # The encrypted key is authenticated along with the data
+    cipherData, tag = cipherObject.encrypt_and_digest(data)
+
+    return wrappedKey + cipherObject.nonce + tag + cipherData
+
+
+
+def hybridDecryption(envelope: bytes, privateKey: RSA.RsaKey) -> bytes:
+    """
+    Decryptes an envelope made by hybridEncryption.
+
+    :param bytes envelope: the envelope
+    :param RSA.RsaKey privateKey: the key used for decryption, has to be private
+    :return: the decrypted data
+    :rtype: bytes
+    :raises TypeError: if the key used for the decryption is not private
+    :raises ValueError: if the key is incorrect or if the data has been corrupted
+    """
+    keySize = privateKey.size_in_bytes()
+    if len(envelope) < keySize + 28:
+        raise ValueError("the envelope is too short")
+
+    wrappedKey = envelope[:keySize]
+    nonce, tag = envelope[keySize:keySize + 12], envelope[keySize + 12:keySize + 28]
+    symmetricKey = PKCS1_OAEP.new(privateKey).decrypt(wrappedKey)
+
+    cipherObject = AES.new(symmetricKey, AES.MODE_GCM, nonce=nonce)
+    cipherObject.update(wrappedKey)
+    try:
+        return cipherObject.decrypt_and_verify(envelope[keySize + 28:], tag)
+    except ValueError:
+        raise ValueError("the key might be incorrect or the data has been corrupted")
+
+
+
 def RSASignature(data: object, privateKey: RSA.RsaKey) -> bytes:
     """
     Signs some data with the PKCS#1 PSS asymmetric cipher (because it is the one provided with the Crypto module).